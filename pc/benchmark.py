@@ -0,0 +1,719 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Benchmarks of the acquisition chain, runnable without the robot and sensors:
+    python benchmark.py line_buffer
+    python benchmark.py robot
+    python benchmark.py sensors
+    python benchmark.py parsing
+    python benchmark.py raw
+    python benchmark.py writer
+    python benchmark.py positions
+    python benchmark.py controller
+    python benchmark.py plot (needs a display)
+    python benchmark.py clock
+    python benchmark.py trajectory
+    python benchmark.py scheduler
+    python benchmark.py levels
+    python benchmark.py profiles
+"""
+
+import argparse
+import csv
+import os
+from datetime import datetime
+import queue
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import robot_control
+from line_buffer import LineBuffer
+from sensor_config import SENSORS
+from sensors import to_float
+from robot_simulator import RobotSimulator
+import sensor_plugins
+import sensor_simulator
+from level_stats import RunningStats, RunningCovariance
+from raw_capture import RawCapture
+from recording import format_row
+from session import AcquisitionSession
+from positions import PositionTable
+from profiles import ProfileGrid
+import controller
+
+
+def synthetic_robot_stream(nb_messages, done_every=50):
+    """Build the bytes of a 'stream_pos' session: posx messages with some 'sgoto,done' in between"""
+    messages = []
+    for i in range(nb_messages):
+        if i % done_every == done_every - 1:
+            messages.append("sgoto,done")
+        else:
+            z = 500 + (i % 1000) * 0.1
+            messages.append(f"posx,-0.12, 700.5, {z:.3f}, 90.0, 180.0, 0.0,2")
+    return ("\r".join(messages) + "\r").encode(), messages
+
+
+def split_in_bursts(data, max_burst, seed=0):
+    """Cut 'data' in reads of random size, like a busy socket"""
+    rng = random.Random(seed)
+    chunks = []
+    i = 0
+    while i < len(data):
+        size = rng.randint(1, max_burst)
+        chunks.append(data[i:i + size])
+        i += size
+    return chunks
+
+
+def legacy_recv(chunks):
+    """Previous TCPClient.recv behaviour: one message kept per read, the rest dropped"""
+    received = []
+    for chunk in chunks:
+        response = chunk.decode()
+        if "\r" in response:
+            parts = response.split("\r")
+            received.append(next((r for r in parts if "done" in r), parts[0]))
+    return received
+
+
+def bench_line_buffer(nb_messages=200000, max_burst=1024):
+    """Throughput and losses of the robot message framing on synthetic bursts"""
+    data, messages = synthetic_robot_stream(nb_messages)
+    chunks = split_in_bursts(data, max_burst)
+
+    start = time.perf_counter()
+    legacy = legacy_recv(chunks)
+    legacy_time = time.perf_counter() - start
+
+    buffer = LineBuffer(b"\r")
+    received = []
+    start = time.perf_counter()
+    for chunk in chunks:
+        received.extend(buffer.feed(chunk))
+    buffer_time = time.perf_counter() - start
+
+    nb_done = sum(1 for m in messages if m == "sgoto,done")
+    print(f"{len(messages)} messages in {len(chunks)} reads (max {max_burst} bytes)")
+    print(f"legacy recv : {len(legacy) / legacy_time:12.0f} msg/s, "
+          f"{len(legacy)} kept, {sum(1 for m in legacy if m == 'sgoto,done')}/{nb_done} 'done'")
+    print(f"LineBuffer  : {len(received) / buffer_time:12.0f} msg/s, "
+          f"{len(received)} kept, {sum(1 for m in received if m == 'sgoto,done')}/{nb_done} 'done', "
+          f"{'in order' if received == messages else 'MISMATCH'}")
+
+
+def connect_to_simulator(simulator):
+    """TCPClient connected to 'simulator', without sensors"""
+    robot = robot_control.TCPClient(simulator.host, simulator.port)
+    robot.send("Hello")
+    robot.recv()
+    return robot
+
+
+def bench_robot(nb_commands=50, stream_time=5.0, latency=0.002, jitter=0.001):
+    """Command latency and posx stream rate of TCPClient against the robot simulator"""
+    simulator = RobotSimulator(port=0, time_scale=0.0, latency=latency, jitter=jitter, seed=0).start(once=True)
+    robot = connect_to_simulator(simulator)
+
+    latencies = []
+    for _ in range(nb_commands):
+        start = time.perf_counter()
+        robot.get_current_posx()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"get_current_posx round trip: median {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"max {latencies[-1] * 1000:.2f} ms (injected {latency * 1000:.1f} + [0, {jitter * 1000:.1f}] ms)")
+
+    # Motion commands one after the other, then all in flight at once
+    poses = [[0, 0, 10 * (i % 2), 90, 180, 0] for i in range(nb_commands)]
+    start = time.perf_counter()
+    for pose in poses:
+        robot.goto(pose)
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    done = [robot.link.submit(robot.link.command("goto", pose)) for pose in poses]
+    for future in done:
+        future.result()
+    pipelined = time.perf_counter() - start
+    print(f"{nb_commands} 'goto' commands: {sequential * 1000:.1f} ms one by one, "
+          f"{pipelined * 1000:.1f} ms pipelined")
+
+    nb_samples = [0]
+    def count(recv_time, message):
+        nb_samples[0] += 1
+    robot.link.subscribe(count)
+    # One message per sample, then batches of samples stamped by the robot
+    for rate, batch in [(simulator.stream_rate, 1), (500, 1), (500, 10), (1000, 20)]:
+        simulator.stream_rate = rate
+        robot.stream_rate = rate
+        robot.stream_batch = batch
+        nb_samples[0] = 0
+        nb_messages = robot.link.nb_messages
+        robot.start_stream()
+        time.sleep(stream_time)
+        robot.stop_stream()
+        time.sleep(0.1)
+        print(f"stream at {rate:4d} Hz, {batch:2d} samples/message: {nb_samples[0] / stream_time:7.1f} samples/s, "
+              f"{(robot.link.nb_messages - nb_messages) / stream_time:6.1f} messages/s")
+    robot.link.unsubscribe(count)
+
+    robot.close_socket()
+    simulator.close()
+
+
+def bench_sensors(rates=(20, 50, 100, 200, 500), duration=3.0):
+    """Lines ingested by get_data from the fake sensors at increasing output rates"""
+    simulator = RobotSimulator(port=0, time_scale=0.0).start()
+    print(f"{'rates':>9} | {'wind sent':>9} {'parsed':>7} {'dropped':>7} | {'co2 sent':>9} {'parsed':>7} {'dropped':>7}")
+    # Last case: a slow CO2 analyser next to a 20 Hz anemometer
+    for wind_rate, co2_rate in [(rate, rate) for rate in rates] + [(20, 0.5)]:
+        wind = sensor_simulator.FakeWindSensor(rate=wind_rate, seed=0)
+        co2 = sensor_simulator.FakeCO2Device(rate=co2_rate, seed=0)
+        robot = robot_control.TCPClient(simulator.host, simulator.port,
+                                        options={option: True for option in sensor_plugins.options()})
+        robot.send("Hello")
+        robot.recv()
+        sensor_simulator.plug(robot, wind=wind, co2=co2)
+        robot.connect_sensors()
+
+        stop_event = threading.Event()
+        reader = threading.Thread(target=robot.get_data, args=(stop_event,))
+        reader.start()
+        time.sleep(duration)
+        stop_event.set()
+        reader.join()
+        wind.close()
+        co2.close()
+        print(f"{wind_rate:>4}/{co2_rate:<4} | {wind.nb_lines:>9} {robot.sensors['wind'].rate.count:>7} {wind.nb_dropped:>7} | "
+              f"{co2.nb_lines:>9} {robot.sensors['co2'].rate.count:>7} {co2.nb_dropped:>7}")
+        robot.close_socket()
+    simulator.close()
+
+
+def record_capture(sensor, path, nb_lines, field, delimiter=None, corrupted=0.01, seed=0):
+    """
+    Write 'nb_lines' lines of a fake sensor to 'path', some of them cut
+    or with a bad value in the field 'field' (index in the line split at 'delimiter')
+    """
+    rng = random.Random(seed)
+    with open(path, "wb") as file:
+        for i in range(nb_lines):
+            line = sensor.line(i / 20)
+            if rng.random() < corrupted:
+                if rng.random() < 0.5:
+                    line = line[:rng.randint(0, len(line) - 1)] + "\n"
+                else:
+                    tokens = line.rstrip("\n").split(delimiter)
+                    tokens[field] = "#" + tokens[field][1:]
+                    line = (delimiter or " ").join(tokens) + "\n"
+            file.write(line.encode("ascii"))
+
+
+def legacy_parse(chunks, fields, delimiter=None):
+    """Previous reader loop: each line decoded, split and converted one value at a time"""
+    rx = LineBuffer(b"\n")
+    rows = []
+    for chunk in chunks:
+        for line in rx.feed(chunk):
+            values = line.split(delimiter)
+            if len(values) <= max(fields):
+                continue
+            rows.append([to_float(values[i]) for i in fields])
+    return rows
+
+
+def bench_parsing(nb_lines=200000, read_sizes=(64, 1024)):
+    """
+    Lines/s of the sensor parsers on captures of the fake sensors, read 'read_sizes' bytes at a time,
+    against the previous loop reading fixed fields
+    """
+    directory = tempfile.mkdtemp()
+    wind = sensor_simulator.FakeWindSensor(seed=0)
+    wind.close()
+    sensors = [("wind", wind, [1, 3, 5, 13, 7, 11], None),
+               ("co2", sensor_simulator.FakeCO2Device(seed=0), [2, 3, 4, 5], "\t")]
+    for name, sensor, fields, delimiter in sensors:
+        path = os.path.join(directory, name + ".txt")
+        record_capture(sensor, path, nb_lines, fields[0], delimiter)
+        with open(path, "rb") as file:
+            data = file.read()
+
+        parser = SENSORS[name].parser()
+        start = time.perf_counter()
+        batch = parser.parse_lines(data.split(b"\n"))
+        batch_time = time.perf_counter() - start
+        print(f"{name:>4}: {len(batch)} complete lines, {int(np.isnan(batch).any(axis=1).sum())} with a bad value, "
+              f"parse_lines on the whole capture {len(batch) / batch_time:8.0f} lines/s")
+
+        for read_size in read_sizes:
+            chunks = [data[i:i + read_size] for i in range(0, len(data), read_size)]
+            start = time.perf_counter()
+            legacy = legacy_parse(chunks, fields, delimiter)
+            legacy_time = time.perf_counter() - start
+
+            parser = SENSORS[name].parser()
+            start = time.perf_counter()
+            parsed = np.concatenate([parser.feed(chunk) for chunk in chunks])
+            feed_time = time.perf_counter() - start
+
+            same = np.array_equal(parsed, np.array(legacy), equal_nan=True) and np.array_equal(parsed, batch, equal_nan=True)
+            print(f"      reads of {read_size:4d} bytes: previous loop {len(legacy) / legacy_time:8.0f} lines/s, "
+                  f"LineParser.feed {len(parsed) / feed_time:8.0f} lines/s ({'same values' if same else 'MISMATCH'})")
+    shutil.rmtree(directory)
+
+
+class FakeRobot():
+    """TCPClient of bench_raw: a wind sensor, and a link whose positions are sent by the benchmark"""
+
+    def __init__(self):
+        self.sensors = {"wind": sensor_plugins.WindSensor()}
+        self.link = self
+        self.nb_actual_field = 1
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+
+def bench_raw(rates=(20, 100, 1000), duration=600.0, position_rate=100, transit=(10.0, 2.0)):
+    """
+    Samples/s of the raw capture writer for 'duration' (s) of wind samples at 'rates' (Hz),
+    and time to add the positions (streamed at 'position_rate', stopped 'transit'[1] s every 'transit'[0] s)
+    """
+    directory = tempfile.mkdtemp()
+    for rate in rates:
+        filename = os.path.join(directory, f"raw_{rate}.csv")
+        capture = RawCapture(filename, FakeRobot())
+        capture.start()
+
+        t0 = time.monotonic()
+        sample_times = t0 + np.arange(0, duration, 1 / rate)
+        samples = np.random.default_rng(0).normal(size=(len(sample_times), SENSORS["wind"].nb_channels))
+        position_times = t0 + np.arange(0, duration, 1 / position_rate)
+        position_times = position_times[(position_times - t0) % transit[0] < transit[0] - transit[1]]
+        start = time.perf_counter()
+        for i in range(0, len(sample_times), 10):  # Sensor reads of 10 lines
+            capture.add("wind", sample_times[i:i + 10], samples[i:i + 10])
+        for t in position_times:
+            capture.add_position(t, f"posx,0,700,{-(t - t0) % 800:.3f},90,180,0,2")
+        capture._queue.put(None)
+        capture._thread.join()
+        write_time = time.perf_counter() - start
+        capture._thread = None
+
+        start = time.perf_counter()
+        capture.stop()
+        positions_time = time.perf_counter() - start
+        print(f"{rate:5d} Hz: {len(sample_times) + len(position_times)} samples written at "
+              f"{(len(sample_times) + len(position_times)) / write_time:8.0f} samples/s, positions added in "
+              f"{positions_time:.2f} s, {next(iter(capture.coverage.values())) * 100:.0f} % of the samples "
+              f"with a position (transits excluded)")
+    shutil.rmtree(directory)
+
+
+WRITER_HEADER = [['Time', 'Position', 'Field number', 'Wind (U)', 'Wind (V)', 'Wind (W)', 'Magnetic',
+                  'Temperature', 'Pressure', 'CO2', 'Humidity', 'Pressure CO2', 'Temperature CO2',
+                  'Mode', 'Frequency'],
+                 ['X', 'X', 'X'] + [True] * 10 + ['Continuous', 20]]
+
+
+def synthetic_row(i):
+    return [time.time_ns(), -0.5 * (i % 600), 1, 1.5, -0.5, 0.1, 180.0, 21.0, 1013.0,
+            420.0, 10.0, 101.3, 25.0]
+
+
+def bench_writer(rates=(20, 100, 1000), duration=3.0, nb_rows=100000):
+    """Rows/s of the recording writer: raw capacity, then paced at acquisition rates"""
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, "bench.csv")
+    rows = [synthetic_row(i) for i in range(nb_rows)]
+
+    # Previous writer: file reopened for every batch of 100 rows
+    start = time.perf_counter()
+    for i in range(0, nb_rows, 100):
+        with open(filename, mode='a', newline='') as file:
+            csv.writer(file).writerows(format_row(row) for row in rows[i:i + 100])
+    print(f"reopen per batch : {nb_rows / (time.perf_counter() - start):10.0f} rows/s")
+
+    session = AcquisitionSession(None)
+    session.start_recording(filename, WRITER_HEADER)
+    start = time.perf_counter()
+    for row in rows:
+        session.put(row)
+    session.stop_recording()
+    print(f"session (queued) : {nb_rows / (time.perf_counter() - start):10.0f} rows/s")
+
+    for rate in rates:
+        session.start_recording(filename, WRITER_HEADER)
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        i = 0
+        while time.perf_counter() - start < duration:
+            session.put(synthetic_row(i))
+            i += 1
+            next_time = start + i / rate
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        session.stop_recording()
+        cpu = time.process_time() - cpu_start
+        with open(filename) as file:
+            nb_written = sum(1 for _ in file) - 2
+        print(f"{rate:>5} Hz paced  : {nb_written / duration:10.1f} rows/s written ({nb_written}/{i}), "
+              f"CPU {100 * cpu / duration:.1f} %")
+    os.remove(filename)
+    os.rmdir(directory)
+
+
+def legacy_find_start_pos(csv_file, distance):
+    """Previous TCPClient.find_start_pos: file read and scanned at every call, last row within 50 mm"""
+    with open(csv_file, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        column_names = next(reader)
+        index_tx = column_names.index('TY')
+        start_field = []
+        for line in reader:
+            try:
+                tx_val = float(line[index_tx])
+                if abs(tx_val - distance) <= 50:
+                    start_field = list(map(float, line[:6]))
+            except (ValueError, IndexError):
+                continue
+        return start_field
+
+
+def bench_positions(nb_lookups=20000):
+    """Latency of the start position lookup in max_positions.csv"""
+    csv_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "max_positions.csv")
+    rng = random.Random(0)
+    distances = [rng.uniform(700, 1600) for _ in range(nb_lookups)]
+
+    start = time.perf_counter()
+    for distance in distances:
+        legacy_find_start_pos(csv_file, distance)
+    legacy = (time.perf_counter() - start) / nb_lookups
+
+    start = time.perf_counter()
+    table = PositionTable(csv_file)
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for distance in distances:
+        table.nearest(distance)
+    nearest = (time.perf_counter() - start) / nb_lookups
+
+    start = time.perf_counter()
+    for distance in distances:
+        table.interpolate(distance)
+    interpolated = (time.perf_counter() - start) / nb_lookups
+
+    print(f"file scan per call  : {legacy * 1e6:8.1f} us")
+    print(f"PositionTable load  : {load * 1e6:8.1f} us (once)")
+    print(f"nearest lookup      : {nearest * 1e6:8.1f} us")
+    print(f"interpolated lookup : {interpolated * 1e6:8.1f} us")
+
+
+class HeadlessApp():
+    """Stand-in for gui.App: holds the command queue and ignores the display calls"""
+
+    def __init__(self):
+        self.app_state = "wait"
+        self.commands = queue.Queue()
+
+    def post(self, command, param=None):
+        self.commands.put((command, param))
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def bench_controller(nb_commands=50, nb_stops=5):
+    """
+    Latency from a GUI command to the matching robot motion command, and from the stop
+    of a measurement pressed in the middle of a descent to the 'stop' of the arm, against the simulator
+    """
+    csv_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "max_positions.csv")
+    simulator = RobotSimulator(port=0, time_scale=0.0, table=PositionTable(csv_file)).start()
+    received = queue.Queue()
+    simulator.on_command = lambda cmd: received.put((time.perf_counter(), cmd))
+
+    app = HeadlessApp()
+    control = controller.Controller(app, app.commands, csv_file)
+    thread = threading.Thread(target=control.run)
+    thread.start()
+    app.post("connect", [simulator.host, simulator.port, {}, {}])
+
+    latencies = []
+    for i in range(nb_commands):
+        start = time.perf_counter()
+        app.post("goto", [700, 90 if i % 2 else 0])
+        while True:
+            t, cmd = received.get(timeout=5)
+            if cmd.startswith("gotoj"):
+                break
+        latencies.append(t - start)
+
+    directory = tempfile.mkdtemp()
+    stops = []
+    for i in range(nb_stops):
+        simulator.time_scale = 0.0
+        app.post("find", [1, 700, 700, 700, 90, 0, -90])
+        app.post("saveground", [-300])
+        while control.state != "ready":
+            time.sleep(0.01)
+        simulator.time_scale = 1.0  # The descent lasts about 15 s
+        app.post("start", [os.path.join(directory, f"stop{i}.csv"), {}, "Continuous", 1, 10, 1, "linear", 2, 0, False])
+        while not received.get(timeout=30)[1].startswith("sgoto"):
+            pass
+        time.sleep(0.5)
+        start = time.perf_counter()
+        app.post("stop_measure")
+        while True:
+            t, cmd = received.get(timeout=30)
+            if cmd == "stop":
+                break
+        simulator.time_scale = 0.0
+        stops.append(t - start)
+        while control.state != "connected":
+            time.sleep(0.01)
+    app.post("close")
+    thread.join()
+    simulator.close()
+    shutil.rmtree(directory)
+
+    latencies.sort()
+    print(f"command -> motion latency: median {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"max {latencies[-1] * 1000:.2f} ms over {nb_commands} 'goto' commands")
+    stops.sort()
+    print(f"stop -> arm stopped latency: median {stops[len(stops) // 2] * 1000:.2f} ms, "
+          f"max {stops[-1] * 1000:.2f} ms over {nb_stops} stops in the middle of a descent")
+
+
+def bench_plot(rates=(20, 100), duration=5.0):
+    """CPU time of the live plot (drain, decimation, drawing) while rows stream at acquisition rates"""
+    import tkinter
+    import live_plot
+    from session import Marker
+
+    names = ['Time', 'Position', 'Field number', 'Wind (U)', 'Wind (V)', 'Wind (W)', 'Magnetic',
+             'Temperature', 'Pressure', 'CO2', 'Humidity', 'Mode', 'Frequency']
+    for rate in rates:
+        root = tkinter.Tk()
+        plot = live_plot.LivePlot(root)
+        plot.start(names)
+        plot.rows.put(Marker("field_start", 1, time.time()))
+        cpu = [0.0]
+        refresh = plot._refresh
+
+        def timed_refresh():
+            start = time.process_time()
+            refresh()
+            cpu[0] += time.process_time() - start
+        plot._refresh = timed_refresh
+
+        rows = [0]
+
+        def feed():
+            i = rows[0]
+            row = synthetic_row(i)
+            row[1] = 500 + 500 * abs((i / (rate * 2)) % 2 - 1)  # Up and down profile
+            plot.rows.put(row)
+            rows[0] += 1
+            root.after(int(1000 / rate), feed)
+        root.after(0, feed)
+        root.after(int(duration * 1000), root.quit)
+        root.mainloop()
+        root.destroy()
+        print(f"{rate:4d} Hz: {rows[0]} rows plotted, plot CPU {cpu[0] / duration * 100:.1f} %")
+
+
+def bench_clock(duration=10.0, latency=0.002, jitter=0.003, offset=1234.5, drift=50.0):
+    """Timing error of the streamed positions: reception time against the estimated robot clock"""
+    simulator = RobotSimulator(port=0, time_scale=0.0, latency=latency, jitter=jitter, seed=0,
+                               clock_offset=offset, clock_drift=drift).start(once=True)
+    robot = connect_to_simulator(simulator)
+    robot.link.start_sync(period=0.1)
+    robot.stream_batch = 1
+
+    errors = {"reception": [], "robot clock": []}
+    def measure(sample_time, message):
+        robot_time = float(message.split(",")[-1])
+        true_time = (robot_time - offset) / (1 + drift * 1e-6)  # Inverse of controller_time()
+        errors["robot clock"].append(sample_time - true_time)
+        errors["reception"].append(time.monotonic() - true_time)
+    time.sleep(2)  # First exchanges
+    robot.link.subscribe(measure)
+    robot.start_stream()
+    time.sleep(duration)
+    robot.stop_stream()
+    robot.link.unsubscribe(measure)
+    print(robot.link.clock.report())
+    for name, values in errors.items():
+        values = sorted(abs(value) for value in values)
+        print(f"{name:>12}: |error| median {values[len(values) // 2] * 1000:.3f} ms, "
+              f"p99 {values[int(len(values) * 0.99)] * 1000:.3f} ms over {len(values)} samples")
+    robot.close_socket()
+    simulator.close()
+
+
+def bench_trajectory(height=800, nb_levels=10, dwell=10):
+    """Column time and measured levels per hour of the trajectory plans"""
+    import trajectory
+    plan = trajectory.plan_field(height, nb_levels)
+    step_by_step = trajectory.FieldPlan(plan.depths, plan.nb_passes).column_time("Discontinuous")
+    single = plan.column_time("Continuous")
+    print(f"Continuous, {height} mm column: {2 * height / step_by_step:.1f} mm/s with a stop at each of "
+          f"{nb_levels} levels, {2 * height / single:.1f} mm/s in one motion per pass")
+    plans = [
+        ("linear, 2 passes (previous loop)", trajectory.plan_field(height, nb_levels, "linear", 2, dwell)),
+        ("linear, 1 pass", trajectory.plan_field(height, nb_levels, "linear", 1, dwell)),
+        ("log, 2 passes", trajectory.plan_field(height, nb_levels, "log", 2, dwell)),
+        ("log, 1 pass", trajectory.plan_field(height, nb_levels, "log", 1, dwell)),
+        ("log, 3 passes", trajectory.plan_field(height, nb_levels, "log", 3, dwell)),
+    ]
+    print(f"{height} mm column, {nb_levels} levels, {dwell} s dwell")
+    for name, plan in plans:
+        column_time = plan.column_time("Discontinuous")
+        nb_measured = plan.nb_levels * plan.nb_passes
+        lowest = height - plan.depths[-1]
+        print(f"{name:>34}: {column_time:6.1f} s, {nb_measured * 3600 / column_time:6.0f} levels/h, "
+              f"lowest level {lowest:.0f} mm above ground")
+
+
+def legacy_cycle_time(start_fields, plans, mode):
+    """Previous loop: per field gotoj to the raised pose, 1 s wait, sgotoj down to the field and back"""
+    import scheduler
+    from trajectory import MOTIONS, motion_time
+    _, vel, acc = MOTIONS["sgotoj"]
+    total = 0.0
+    posej = controller.INITIAL_POSEJ
+    for start_field, plan in zip(start_fields, plans):
+        raised = [start_field[0], 0, 10, 0, 80, 180]
+        slow = motion_time(max(abs(a - b) for a, b in zip(raised, start_field)), vel, acc)
+        total += scheduler.transit_time(posej, raised) + 1 + 2 * slow + plan.column_time(mode)
+        posej = raised
+    return total
+
+
+def bench_scheduler(distance=700, height=800, meas_time=30 * 60):
+    """Estimated time per cycle of 3 fields and cycles per measurement, previous loop against the scheduler"""
+    import scheduler
+    import trajectory
+    table = PositionTable(os.path.join(os.path.dirname(os.path.abspath(__file__)), "max_positions.csv"))
+    start_fields = []
+    for angle in (90, 0, -90):
+        start_field = table.nearest(distance)
+        start_field[0] = angle
+        start_fields.append(start_field)
+    for mode, nb_levels, dwell in (("Continuous", 1, 0), ("Discontinuous", 10, 10)):
+        plans = [trajectory.plan_field(height, nb_levels, "linear", 2, dwell) for _ in start_fields]
+        fields = scheduler.FieldScheduler(start_fields, plans, controller.INITIAL_POSEJ)
+        fields.posej = start_fields[-1]  # Steady state: a cycle starts where the previous one ended
+        legacy = legacy_cycle_time(start_fields, plans, mode)
+        scheduled = fields.cycle_estimate(mode)
+        print(f"{mode:>13}: {legacy:6.1f} s per cycle before, {scheduled:6.1f} s with the scheduler, "
+              f"{int(meas_time // legacy)} -> {int(meas_time // scheduled)} cycles in {meas_time // 60} min")
+
+
+def bench_levels(nb_samples=1000000, read_size=10, offset=400.0):
+    """
+    Samples/s of the level statistics accumulated in reads of 'read_size' samples,
+    and their error against NumPy on the whole level, with a naive sum of squares for comparison
+    """
+    rng = np.random.default_rng(0)
+    w = rng.normal(0, 0.3, nb_samples)
+    c = offset + 5 * w + rng.normal(0, 1, nb_samples)  # CO2-like: large mean, small fluctuations
+    samples = np.column_stack([w, c])
+    stats = RunningStats(2)
+    flux = RunningCovariance()
+    start = time.perf_counter()
+    for i in range(0, nb_samples, read_size):
+        stats.update(samples[i:i + read_size])
+        flux.update(w[i:i + read_size], c[i:i + read_size])
+    elapsed = time.perf_counter() - start
+
+    std = samples.std(axis=0, ddof=1)
+    covariance = np.cov(w, c)[0, 1]
+    naive = np.sqrt((np.sum(c.astype(np.float32) ** 2) - np.sum(c.astype(np.float32)) ** 2 / nb_samples) / (nb_samples - 1))
+    print(f"{nb_samples} samples in reads of {read_size}: {nb_samples / elapsed:8.0f} samples/s")
+    print(f"  relative error of std(c): Welford {abs(stats.std[1] / std[1] - 1):.1e}, "
+          f"naive sum of squares (float32) {abs(naive / std[1] - 1):.1e}")
+    print(f"  relative error of cov(w, c): {abs(flux.covariance / covariance - 1):.1e}")
+
+
+def bench_profiles(nb_rows=300000, step=25.0):
+    """Rows/s of the profiles of a CSV recording, against a loop over the rows with csv and strptime"""
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, "bench.csv")
+    with open(filename, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerows(WRITER_HEADER)
+        for i in range(nb_rows):
+            row = synthetic_row(i)
+            row[0] += i * 50000000
+            row[2] = 1 + i // 1000 % 4
+            if i % 97 == 0:
+                row[9] = float("nan")
+            writer.writerow(format_row(row))
+    size = os.path.getsize(filename) / 2 ** 20
+
+    # Previous way: one row at a time, sums per field and bin
+    start = time.perf_counter()
+    sums = {}
+    with open(filename, newline="") as file:
+        reader = csv.reader(file)
+        next(reader)
+        next(reader)
+        for cells in reader:
+            datetime.strptime(cells[0], "%Y-%m-%d %H:%M:%S.%f")
+            values = [to_float(value) for value in cells[1:]]
+            key = (int(values[1]), int(np.floor(values[0] / step)))
+            total = sums.setdefault(key, [0, 0.0])
+            if not np.isnan(values[8]):
+                total[0] += 1
+                total[1] += values[8]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    grid = ProfileGrid(step)
+    grid.add_file(filename, chunk_bytes=4 * 2 ** 20)
+    grid_time = time.perf_counter() - start
+
+    means = [grid.mean["CO2"][grid.keys[key]] for key in sorted(sums)]
+    same = np.allclose(means, [total / n for n, total in (sums[key] for key in sorted(sums))])
+    print(f"{nb_rows} rows ({size:.0f} MB): rows one at a time {nb_rows / legacy_time:8.0f} rows/s, "
+          f"ProfileGrid in chunks of 4 MB {nb_rows / grid_time:8.0f} rows/s ({'same means' if same else 'MISMATCH'})")
+    shutil.rmtree(directory)
+
+
+BENCHMARKS = {
+    "line_buffer": bench_line_buffer,
+    "robot": bench_robot,
+    "sensors": bench_sensors,
+    "parsing": bench_parsing,
+    "raw": bench_raw,
+    "writer": bench_writer,
+    "positions": bench_positions,
+    "controller": bench_controller,
+    "plot": bench_plot,
+    "clock": bench_clock,
+    "trajectory": bench_trajectory,
+    "scheduler": bench_scheduler,
+    "levels": bench_levels,
+    "profiles": bench_profiles,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the acquisition chain")
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    args = parser.parse_args()
+    BENCHMARKS[args.name]()
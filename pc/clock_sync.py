@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Offset and drift of the robot controller clock against time.monotonic() of the PC,
+estimated from NTP-style exchanges on the robot socket:
+    PC sends 'sync,t1' at t1, the robot answers 'sync,t1,t2,t3' (its clock at
+    reception and at sending), the answer arrives at t4.
+    offset = ((t2 - t1) + (t3 - t4)) / 2, round trip delay = (t4 - t1) - (t3 - t2)
+Exchanges delayed by queueing (e.g. the robot busy with a motion) have a long
+round trip and are left out; offset and drift are fitted on the fastest ones.
+"""
+
+from collections import deque
+
+import numpy as np
+
+
+class ClockSync():
+    """Conversion of robot controller times to PC time.monotonic()"""
+
+    def __init__(self, window=64, max_delay=0.05):
+        """
+        Params:\n
+            - 'window': exchanges used for the estimation, the most recent ones
+            - 'max_delay': exchanges with a longer round trip are not used (s)
+        """
+        self.max_delay = max_delay
+        self.exchanges = deque(maxlen=window)  # (PC time, offset, delay)
+        self.nb_exchanges = 0
+        self.nb_rejected = 0
+        self.offset = None  # Robot time - PC time at 'reference' (s)
+        self.drift = 0.0  # Change of the offset per second
+        self.reference = 0.0
+        self.jitter = 0.0  # Standard deviation of the offsets around the fit (s)
+
+    @property
+    def ready(self):
+        return self.offset is not None
+
+    def add(self, t1, t2, t3, t4):
+        """Add the exchange 't1' (PC), 't2', 't3' (robot), 't4' (PC)"""
+        self.nb_exchanges += 1
+        delay = (t4 - t1) - (t3 - t2)
+        if delay > self.max_delay:
+            self.nb_rejected += 1
+            return
+        self.exchanges.append(((t1 + t4) / 2, ((t2 - t1) + (t3 - t4)) / 2, delay))
+        self._fit()
+
+    def _fit(self):
+        # Half of the exchanges, those with the shortest round trips
+        best = sorted(self.exchanges, key=lambda exchange: exchange[2])[:max(len(self.exchanges) // 2, 1)]
+        times = np.array([exchange[0] for exchange in best])
+        offsets = np.array([exchange[1] for exchange in best])
+        self.reference = float(times.mean())
+        if len(best) >= 3 and np.ptp(times) > 0:
+            self.drift, self.offset = np.polyfit(times - self.reference, offsets, 1)
+            self.drift, self.offset = float(self.drift), float(self.offset)
+            residuals = offsets - (self.offset + self.drift * (times - self.reference))
+        else:
+            self.offset = float(np.median(offsets))
+            residuals = offsets - self.offset
+        self.jitter = float(residuals.std())
+
+    def to_local(self, robot_time):
+        """PC time.monotonic() at which the robot clock showed 'robot_time'"""
+        # robot_time = t + offset + drift * (t - reference), solved for t
+        return (robot_time - self.offset + self.drift * self.reference) / (1 + self.drift)
+
+    def statistics(self):
+        """Offset, drift, round trip and jitter of the estimation"""
+        delays = [exchange[2] for exchange in self.exchanges]
+        return {
+            "exchanges": self.nb_exchanges,
+            "rejected": self.nb_rejected,
+            "offset_s": self.offset,
+            "drift_ppm": self.drift * 1e6,
+            "delay_min_ms": min(delays) * 1000 if delays else None,
+            "delay_median_ms": float(np.median(delays)) * 1000 if delays else None,
+            "jitter_ms": self.jitter * 1000,
+        }
+
+    def report(self):
+        """Statistics as a line of text, for the end of a recording"""
+        if not self.ready:
+            return f"Robot clock not synchronised ({self.nb_exchanges} exchanges, {self.nb_rejected} rejected)"
+        stats = self.statistics()
+        return ("Robot clock: offset {offset_s:.4f} s, drift {drift_ppm:.1f} ppm, "
+                "round trip {delay_min_ms:.2f} ms min / {delay_median_ms:.2f} ms median, "
+                "jitter {jitter_ms:.3f} ms over {exchanges} exchanges ({rejected} rejected)").format(**stats)
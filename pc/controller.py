@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+State machine of the measurement. The GUI posts commands (name, parameters)
+in a thread-safe queue; the control thread blocks on this queue, so a command
+is handled as soon as it is posted instead of at the next polling period.
+During a measurement a watcher thread reads the queue instead, so a stop
+interrupts the motion in progress.
+"""
+
+import os
+import queue
+import threading
+import time
+
+import journal                # Custom module recovering interrupted recordings
+import robot_control          # Custom module handling robot communications
+import scheduler              # Custom module ordering the fields and the moves between them
+import sensor_plugins         # Custom module reading the sensors
+import trajectory             # Custom module planning the levels of each field
+from positions import PositionNotFound
+
+# States of the controller and the commands they accept; other commands are ignored
+TRANSITIONS = {
+    "disconnected": {"connect", "close"},
+    "connected": {"connect", "unconnect", "goto", "find", "close"},
+    "finding_ground": {"gotoground", "saveground", "stop_find", "close"},
+    "ready": {"unconnect", "start", "stop", "close"},
+    "recording": {"update", "stop_measure", "close"},
+    "closed": set(),
+}
+
+INITIAL_POSEJ = [0, 0, 140, 0, -50, 180]  # Robot's home pose
+
+
+class Controller():
+    """Robot connection, positioning and measurements, driven by the commands of the GUI"""
+
+    def __init__(self, app, commands, csv_file, record_formats=("csv",), live_rows=None):
+        """
+        Params:\n
+            - 'app': GUI informed of the progress, through its thread-safe channel (gui.GuiChannel)
+            - 'commands': queue of (command, parameters) posted by the GUI
+            - 'csv_file': max_positions.csv
+            - 'record_formats': recording formats, keys of recording.WRITERS
+            - 'live_rows': session.LiveQueue of the live plot fed with the measurement rows, or None
+        """
+        self.app = app
+        self.commands = commands
+        self.csv_file = csv_file
+        self.record_formats = list(record_formats)
+        self.live_rows = live_rows
+        self.state = "disconnected"
+        self.robot = None
+
+        self.meas_time = 30 * 60  # Measurement time (s)
+        self.start_time = time.time()
+        self.nb_fields = 0
+        self.start_fields = []
+        self.ground_level = []
+
+    # ==== Commands ====
+    def run(self):
+        """Handle the commands until the GUI is closed"""
+        while self.state != "closed":
+            command, param = self.commands.get()
+            try:
+                self.handle(command, param)
+            except (ConnectionError, TimeoutError, PositionNotFound, ValueError) as e:
+                self.recover(command, e)
+
+    def handle(self, command, param):
+        if command not in TRANSITIONS[self.state]:
+            return
+        getattr(self, "on_" + command)(param)
+
+    def recover(self, command, error):
+        """
+        After 'command' failed with 'error': stop the recording and tell the user, then wait
+        in connected, or in disconnected if the link to the robot is down
+        """
+        robot = self.robot
+        recording = robot is not None and robot.session is not None and robot.session.journal is not None
+        if recording:
+            robot.session.stop_recording()
+            self.app.stop_live_plot()
+        closing = command == "close" or self.state == "close"
+        if not closing and (recording or self.state == "finding_ground"):
+            self.app.set_state("stop_find" if self.state == "finding_ground" else "stop_measure")
+            self.app.end_recording()
+
+        if closing or robot is None or not robot.link.connected:
+            if robot:
+                try:
+                    robot.close_socket()
+                except ConnectionError:
+                    pass  # Nothing to tell a robot that is gone
+            self.robot = None
+            if closing:
+                self.state = "closed"
+                return
+            self.app.connection_error()
+            self.app.disconnected()
+            self.state = "disconnected"
+            return
+
+        if recording:
+            self.app.write_error(f"measurement stopped: {str(error) or error.__class__.__name__}")
+        else:
+            self.app.connection_error()
+        self.app.set_state("connected")
+        self.state = "connected"
+
+    def wait_command(self, expected):
+        """Block until one of the 'expected' commands is posted, the others are dropped"""
+        while True:
+            command, param = self.commands.get()
+            if command in expected:
+                return command, param
+
+    def watch_commands(self, done):
+        """
+        Handle the commands posted during a measurement until 'done' is set;
+        a stop or a close interrupts the motion or dwell in progress (see TCPClient.interrupt())
+        """
+        while not done.is_set():
+            try:
+                command, param = self.commands.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if command == "update":
+                self.on_update(param)
+            elif command in ("stop_measure", "close"):
+                self.state = command
+                self.robot.interrupt()
+
+    # ==== Transitions ====
+    def on_connect(self, param):
+        ip, port, options, settings = param[:4]
+        # Plugins of the sensors with a recorded channel, with their settings from the GUI
+        sensors = [cls(**settings.get(name, {})) for name, cls in sensor_plugins.PLUGINS.items()
+                   if cls.description.used(options)]
+        robot = None
+        try:
+            robot = robot_control.TCPClient(ip, port, sensors, options)
+            robot.send("Hello")
+            robot.recv()  # Check if connection works
+            robot.connect_sensors()
+            robot.start_session()  # Sensors stream until disconnection
+            robot.session.on_error = self.app.write_error
+            robot.session.live = self.live_rows
+            robot.csv_file = self.csv_file
+            self.robot = robot
+            self.state = "connected"
+            self.app.set_state("connected")
+        except Exception:
+            if robot:
+                robot.close_socket()
+            self.app.connection_error()
+
+    def on_unconnect(self, param):
+        self.app.set_state("wait")
+        self.disconnect()
+        self.state = "disconnected"
+
+    def disconnect(self):
+        if self.robot:
+            self.robot.stop()
+            time.sleep(0.1)
+            self.robot.close_socket()
+            self.robot = None
+
+    def on_goto(self, param):
+        distance, angle = param
+        try:
+            start_field = self.robot.find_start_pos(distance)
+            start_field[0] = angle
+            self.robot.gotoj(start_field)
+        except PositionNotFound:
+            self.app.position_error(distance)
+        self.app.set_state("wait")
+
+    def on_find(self, param):
+        """Find the ground of each field, moved by the user"""
+        self.state = "finding_ground"
+        self.app.set_state("find_ground")
+        robot = self.robot
+
+        #Repositioning to the starting position
+        robot.gotoj(INITIAL_POSEJ)
+
+        self.ground_level = []
+        self.start_fields = []
+        self.nb_fields = param[0]
+        distances = param[1:4]
+        angles = param[4:7]
+        command = None
+        for i in range(self.nb_fields):
+            self.app.find_ground(i)
+            try:
+                start_field = robot.find_start_pos(distances[i])
+            except PositionNotFound:
+                self.app.position_error(distances[i])
+                command = "stop_find"
+                break
+            start_field[0] = angles[i]
+            self.start_fields.append(start_field)
+            robot.gotoj(start_field)
+            start_field_xyz = robot.get_current_posx()
+
+            command, ground_distance = self.wait_command({"gotoground", "saveground", "stop_find", "close"})
+            while command == "gotoground":
+                arm_position = robot.get_current_posx()
+                arm_position[2] = ground_distance[0]
+                robot.goto(arm_position)
+                command, ground_distance = self.wait_command({"gotoground", "saveground", "stop_find", "close"})
+
+            if command != "saveground":
+                break
+            self.ground_level.append(start_field_xyz[2] - ground_distance[0])
+            robot.goto(start_field_xyz)
+
+        if command == "close":
+            self.on_close(None)
+            return
+        if command == "saveground":
+            self.app.set_state("ground_fond")
+            self.state = "ready"
+        robot.gotoj(INITIAL_POSEJ)
+        if command != "saveground":
+            self.app.set_state("stop_find")
+            self.app.end_recording()
+            self.state = "connected"
+
+    def on_stop(self, param):
+        self.app.set_state("stop")
+        self.app.end_recording()
+        self.state = "connected"
+
+    def on_update(self, param):
+        self.meas_time = param[0] * 60 #in second
+
+    def update_gui_counter(self):
+        """Update progress in the GUI"""
+        progress = (time.time() - self.start_time)/self.meas_time
+        if self.state != "close":
+            self.app.update_counter(progress)
+
+    def on_start(self, param):
+        """Record up and down profiles in every field during the measurement time"""
+        self.state = "recording"
+        self.start_time = time.time()
+        robot = self.robot
+
+        # Extract measurement parameters
+        filename = param[0]
+        robot.options = param[1]
+        mode = param[2]
+        nb_points = param[3]
+        robot.freq = param[4]
+        self.on_update(param[5:6])
+        spacing, nb_passes, dwell = param[6:9]
+        raw = param[9]
+        plans = [trajectory.plan_field(ground_level, nb_points, spacing, nb_passes, dwell)
+                 for ground_level in self.ground_level]
+
+        header = self.header(mode, nb_points, spacing, nb_passes, dwell)
+
+        # Recording interrupted by a crash: rebuild its files from the journal and resume it
+        resume = None
+        remaining = None  # Fields left in the cycle interrupted by the crash, None for a whole cycle
+        if journal.interrupted(filename) and self.app.ask_resume(filename):
+            resume = journal.replay(filename)
+            self.start_time = time.time() - resume["elapsed"]
+            remaining = journal.resume_fields(resume)
+
+        # Create the recording files with their header
+        self.app.start_live_plot(header[0])
+        try:
+            robot.filename = filename
+            # Level statistics need samples: none without a dwell at the levels
+            robot.session.start_recording(filename, header, self.record_formats, resume, raw,
+                                          levels=mode == "Discontinuous" and dwell > 0)
+        except IOError:
+            self.app.error_file()
+            self.app.stop_live_plot()
+            self.app.set_state("stop_measure")
+            self.app.end_recording()
+            self.state = "connected"
+            return
+
+        # Measurement loop: cycles over the fields, in the order with the shortest moves between them
+        robot.vertical_speeds = []
+        fields = scheduler.FieldScheduler(self.start_fields, plans, INITIAL_POSEJ)
+        self.app.set_state("record")
+        robot.interrupted.clear()
+        done = threading.Event()
+        watcher = threading.Thread(target=self.watch_commands, args=(done,), daemon=True)
+        watcher.start()
+        try:
+            while time.time() - self.start_time < self.meas_time and self.state == "recording":
+                fields.start_cycle()
+                order = fields.order(remaining)
+                robot.session.remaining = list(order)
+                for j in order:
+                    if self.state != "recording":
+                        break
+                    robot.nb_actual_field = j + 1
+                    try:
+                        robot.up_down_field(mode, self.start_fields[j], plans[j], callback=self.update_gui_counter)
+                    except robot_control.MeasurementStopped:
+                        break  # The field is measured again if the recording is resumed
+                    fields.moved_to(j)
+                else:
+                    if remaining is None:
+                        fields.end_cycle()  # Only the complete cycles are timed
+                remaining = None
+        finally:
+            done.set()
+            watcher.join()
+            robot.interrupted.clear()
+
+        # End of measurements
+        robot.session.stop_recording()
+        self.app.stop_live_plot()
+        robot.gotoj(INITIAL_POSEJ)
+        if self.state == "close":
+            self.on_close(None)
+            return
+        reports = [robot.link.clock.report(), robot.speed_report(), fields.report()]
+        if robot.session.raw:
+            reports.append(robot.session.raw.report())
+        if robot.session.levels:
+            reports.append(robot.session.levels.report())
+        self.app.saved_file(os.path.abspath(filename), "\n".join(reports))
+        self.app.set_state("stop_measure")
+        self.app.end_recording()
+        self.state = "connected"
+
+    def header(self, mode, nb_points, spacing="linear", nb_passes=2, dwell=0):
+        """Names and units/flags rows of the CSV header, the sensor columns being those of the robot's plugins"""
+        row = ['Time', 'Position','Field number']
+        row2 = ['X','X','X']
+        for channel in self.robot.columns():
+            row.append(channel.name)
+            row2.append(channel.unit)
+
+        row.append('Mode')
+        row2.append(mode)
+        if mode == "Continuous":
+            row.append('Frequency')
+            row2.append(self.robot.freq)
+        else:
+            row.append('Number of points')
+            row2.append(nb_points)
+            row.extend(['Levels', 'Dwell (s)'])
+            row2.extend([spacing, dwell])
+        row.append('Passes')
+        row2.append(nb_passes)
+        return [row, row2]
+
+    def on_close(self, param):
+        """Stop the robot and release everything when the GUI is closed"""
+        if self.robot:
+            self.robot.send("stop_stream")
+            time.sleep(0.1)
+            self.disconnect()
+        self.state = "closed"
@@ -3,10 +3,16 @@
 Made by Arthur Saint Upery and Ewan Maurel
 """
 import os
+import queue
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 from datetime import datetime
 import sys
+import sensor_plugins  # Sensors: checkboxes and connection settings of the interface
+try:
+    import live_plot  # Needs matplotlib; the interface works without the live plot
+except ImportError:
+    live_plot = None
 
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("dark-blue")
@@ -19,9 +25,70 @@ def resource_path(rel_path):
     base_path = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base_path, rel_path)
 
+class GuiChannel():
+    """
+    Calls of the worker threads to the App, run by the Tk thread only.
+    Calls are queued and a Tk.after pump runs them at a fixed frame rate;
+    for the progress methods, only the latest call of a frame is run.
+    """
+
+    COALESCED = {"update_counter"}
+    ASKED = {"ask_resume"}  # The worker thread waits for the answer of these
+
+    def __init__(self, app, frame_rate=20):
+        self._app = app
+        self._period = int(1000 / frame_rate)
+        self._calls = queue.Queue()
+        self._closed = False
+
+    def __getattr__(self, name):
+        getattr(self._app, name)  # Unknown methods fail in the calling thread
+        if name in self.ASKED:
+            def ask(*args):
+                answer = queue.Queue()
+                self._calls.put((name, args, answer))
+                while not self._closed:
+                    try:
+                        return answer.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                return None  # Window closed before the answer
+            return ask
+
+        def call(*args):
+            self._calls.put((name, args, None))
+        return call
+
+    def start(self):
+        self._app.after(self._period, self._pump)
+
+    def close(self):
+        self._closed = True
+
+    def _pump(self):
+        calls = []
+        while True:
+            try:
+                calls.append(self._calls.get_nowait())
+            except queue.Empty:
+                break
+        latest = {name: i for i, (name, args, answer) in enumerate(calls) if name in self.COALESCED}
+        try:
+            for i, (name, args, answer) in enumerate(calls):
+                if name in self.COALESCED and latest[name] != i:
+                    continue
+                result = getattr(self._app, name)(*args)
+                if answer is not None:
+                    answer.put(result)
+        finally:
+            if not self._closed:
+                self._app.after(self._period, self._pump)
+
+
 class App(ctk.CTk):
     def __init__(self):
         self.app_state = "wait"
+        self.commands = queue.Queue()  # (command, parameters) for the control thread
         
         super().__init__()
         self.title("Robot App")
@@ -45,20 +112,20 @@ class App(ctk.CTk):
         self.angle3 = ctk.StringVar(value="-90")
         self.gposition = ctk.StringVar(value="0")
         self.meas_time = ctk.StringVar(value="30")
+        self.nb_passes = ctk.StringVar(value="2")
+        self.spacing = ctk.StringVar(value="linear")
+        self.dwell = ctk.StringVar(value="0")
 
-        self.measure_temp = ctk.BooleanVar(value=False)
-        self.measure_wind = ctk.BooleanVar(value=False)
-        self.measure_press = ctk.BooleanVar(value=False)
-        self.measure_hum = ctk.BooleanVar(value=False)
-        self.measure_co2 = ctk.BooleanVar(value=False)
-        self.measure_intern_co2 = ctk.BooleanVar(value=False)
+        # Checkbox of each option of the sensor plugins
+        self.measure = {option: ctk.BooleanVar(value=False) for option in sensor_plugins.options()}
+        self.raw_capture = ctk.BooleanVar(value=False)  # Every sensor sample in raw files, see raw_capture
 
         # Technical settings
         self.ip_bras = ctk.StringVar(value="192.168.137.100")
         self.port_bras = ctk.StringVar(value=20002)
-        self.serial_port = ctk.StringVar(value="COM6")
-        self.co2_vendor = ctk.StringVar(value="1509")
-        self.co2_product = ctk.StringVar(value="0A02")
+        # Connection settings of each sensor plugin
+        self.sensor_settings = {name: {key: ctk.StringVar(value=default) for key, _, default in cls.settings}
+                                for name, cls in sensor_plugins.PLUGINS.items()}
 
         # === CSV saving file creation ===
         exe_dir = os.path.dirname(os.path.abspath(__file__))
@@ -71,6 +138,11 @@ class App(ctk.CTk):
 
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
+        # Worker threads reach the interface through this channel only
+        self.ui = GuiChannel(self)
+        self.ui.start()
+        self.after(1000, self.refresh_state)
+
     def init_interface(self):
         main_frame = ctk.CTkFrame(self)
         main_frame.grid(row=1, column=0, columnspan=2, padx=20, pady=10, sticky="nsew")
@@ -82,6 +154,7 @@ class App(ctk.CTk):
         self.init_main_frame(main_frame)
         self.init_tech_frame(main_frame)
         self.init_position_frame(main_frame)
+        self.init_plot_frame(main_frame)
 
     # Layout interface settings
     def init_main_frame(self, parent):
@@ -101,21 +174,26 @@ class App(ctk.CTk):
         self.nb_fields_menu = ctk.CTkOptionMenu(frame, values=["1", "2", "3"], variable=self.nb_fields, command=self.update_fields)
         self.nb_fields_menu.grid(row=2, column=1, pady=(10, 0), sticky="w")
 
+        # Passes over each field, alternately down and up
+        ctk.CTkLabel(frame, text="Passes per field (> 0) :").grid(row=3, column=0, padx=5, pady=(10, 0), sticky="w")
+        self.passes_entry = ctk.CTkEntry(frame, textvariable=self.nb_passes)
+        self.passes_entry.grid(row=3, column=1, pady=(10, 0), sticky="w")
+
 
         # Quantities to measure
         ctk.CTkLabel(frame, text="Measured variables :").grid(row=4, column=0, columnspan=2, padx=5, pady=(10, 0), sticky="w")
-        self.temp_box = ctk.CTkCheckBox(frame, text="Temperature", variable=self.measure_temp, command=self.wind_selected)
-        self.temp_box.grid(row=5, column=0, padx=5, sticky="w")
-        self.pres_box = ctk.CTkCheckBox(frame, text="Pressure", variable=self.measure_press, command=self.wind_selected)
-        self.pres_box.grid(row=5, column=1, padx=5, sticky="w")
-        self.wind_box = ctk.CTkCheckBox(frame, text="Wind", variable=self.measure_wind, command=self.wind_selected)
-        self.wind_box.grid(row=6, column=0, padx=5, pady=5, sticky="w")
-        self.h2o_box = ctk.CTkCheckBox(frame, text="H2O", variable=self.measure_hum, command=self.co2_selected)
-        self.h2o_box.grid(row=6, column=1, padx=5, pady=5, sticky="w")
-        self.co2_box = ctk.CTkCheckBox(frame, text="CO2", variable=self.measure_co2, command=self.co2_selected)
-        self.co2_box.grid(row=7, column=0, padx=5, sticky="w")
-        self.intern_co2_box = ctk.CTkCheckBox(frame, text="P and T (CO2)", variable=self.measure_intern_co2, command=self.co2_selected)
-        self.intern_co2_box.grid(row=7, column=1, padx=5, sticky="w")
+        boxes_frame = ctk.CTkFrame(frame, fg_color="transparent")
+        boxes_frame.grid(row=5, column=0, columnspan=2, rowspan=3, sticky="w")
+        self.option_boxes = {}
+        for name, cls in sensor_plugins.PLUGINS.items():
+            for option, label in cls.description.options.items():
+                i = len(self.option_boxes)
+                box = ctk.CTkCheckBox(boxes_frame, text=label, variable=self.measure[option],
+                                      command=lambda name=name: self.sensor_selected(name))
+                box.grid(row=i // 2, column=i % 2, padx=5, pady=2, sticky="w")
+                self.option_boxes[option] = box
+        self.raw_box = ctk.CTkCheckBox(frame, text="Raw sensor capture", variable=self.raw_capture)
+        self.raw_box.grid(row=5, column=2, padx=5, pady=2, sticky="w")
 
         # Amount of up & down and repetitions
         ctk.CTkLabel(frame, text="Measurement time (min):").grid(row=8, column=0, padx=5, pady=(10, 0), sticky="w")
@@ -138,6 +216,16 @@ class App(ctk.CTk):
         self.nb_label.grid_remove()
         self.nb_entry.grid_remove()
 
+        # Levels of the Discontinuous mode: spacing and time recorded at each of them
+        self.levels_frame = ctk.CTkFrame(frame, fg_color="transparent")
+        self.levels_frame.grid(row=10, column=2, pady=(10, 0), sticky="w")
+        self.spacing_menu = ctk.CTkOptionMenu(self.levels_frame, values=["linear", "log"], variable=self.spacing, width=80)
+        self.spacing_menu.grid(row=0, column=0, padx=5)
+        ctk.CTkLabel(self.levels_frame, text="Dwell (s) :").grid(row=0, column=1, padx=5)
+        self.dwell_entry = ctk.CTkEntry(self.levels_frame, textvariable=self.dwell, width=50)
+        self.dwell_entry.grid(row=0, column=2)
+        self.levels_frame.grid_remove()
+
         
         ctk.CTkLabel(frame, text="").grid(row=11, column=0, columnspan=2, pady=20)
 
@@ -202,43 +290,35 @@ class App(ctk.CTk):
         self.port_entry = ctk.CTkEntry(tech_frame, textvariable=self.port_bras)
         self.port_entry.grid(row=2, column=1, padx=5, pady=5)
 
-        # Wind sensor communnication port
-        self.seral_port_label = ctk.CTkLabel(tech_frame, text="Serial port wind sensor :")
-        self.seral_port_label.grid(row=3, column=0, sticky="e", padx=5, pady=5)
-        self.seral_port_label.grid_remove()
-        self.seral_port_entry = ctk.CTkEntry(tech_frame, textvariable=self.serial_port)
-        self.seral_port_entry.grid(row=3, column=1, padx=5, pady=5)
-        self.seral_port_entry.grid_remove()
-
-        # CO2 sensor identifier
-        self.co2_vendor_label = ctk.CTkLabel(tech_frame, text="CO2 idVendor :")
-        self.co2_vendor_label.grid(row=4, column=0, sticky="e", padx=5, pady=5)
-        self.co2_vendor_label.grid_remove()
-        self.co2_vendor_entry = ctk.CTkEntry(tech_frame, textvariable=self.co2_vendor)
-        self.co2_vendor_entry.grid(row=4, column=1, padx=5, pady=5)
-        self.co2_vendor_entry.grid_remove()
-
-        self.co2_product_label = ctk.CTkLabel(tech_frame, text="CO2 idProduct :")
-        self.co2_product_label.grid(row=5, column=0, sticky="e", padx=5, pady=5)
-        self.co2_product_label.grid_remove()
-        self.co2_product_entry = ctk.CTkEntry(tech_frame, textvariable=self.co2_product)
-        self.co2_product_entry.grid(row=5, column=1, padx=5, pady=5)
-        self.co2_product_entry.grid_remove()
+        # Connection settings of the sensors, shown when one of their channels is recorded
+        self.settings_widgets = {}
+        row = 3
+        for name, cls in sensor_plugins.PLUGINS.items():
+            self.settings_widgets[name] = []
+            for key, label, _ in cls.settings:
+                setting_label = ctk.CTkLabel(tech_frame, text=label)
+                setting_label.grid(row=row, column=0, sticky="e", padx=5, pady=5)
+                setting_label.grid_remove()
+                setting_entry = ctk.CTkEntry(tech_frame, textvariable=self.sensor_settings[name][key])
+                setting_entry.grid(row=row, column=1, padx=5, pady=5)
+                setting_entry.grid_remove()
+                self.settings_widgets[name].append((setting_label, setting_entry))
+                row += 1
 
         # Robot connection button and display
         self.connected_button = ctk.CTkButton(tech_frame, text="Connect", command=self.connect)
-        self.connected_button.grid(row=6, column=0, padx=5, pady=10)
+        self.connected_button.grid(row=row, column=0, padx=5, pady=10)
         self.unconnected_button = ctk.CTkButton(tech_frame, text="Unconnect", command=self.unconnect)
-        self.unconnected_button.grid(row=6, column=0, padx=5, pady=10)
+        self.unconnected_button.grid(row=row, column=0, padx=5, pady=10)
         self.unconnected_button.grid_remove()
 
         #Connection loading display
         self.connected_label = ctk.CTkLabel(tech_frame, text="● Connected", text_color="green")
-        self.connected_label.grid(row=6, column=1, padx=5, sticky="we")
+        self.connected_label.grid(row=row, column=1, padx=5, sticky="we")
         self.connected_label.grid_remove()
 
         self.unconnected_label = ctk.CTkLabel(tech_frame, text="Not connected", text_color="red")
-        self.unconnected_label.grid(row=6, column=1, padx=5, sticky="we")
+        self.unconnected_label.grid(row=row, column=1, padx=5, sticky="we")
 
     # Fields position window settings
     def init_position_frame(self, parent):
@@ -333,6 +413,19 @@ class App(ctk.CTk):
         self.gposition3_label.grid(row=1, column=0, sticky="we", padx=5, pady=(15,5))
         self.gposition3_label.grid_remove()
 
+    # Live plot of the current field
+    def init_plot_frame(self, parent):
+        self.live_plot = None
+        if live_plot is None:
+            return
+        frame = ctk.CTkFrame(parent)
+        frame.grid(row=0, column=2, rowspan=2, padx=20, pady=10, sticky="nsew")
+        parent.grid_columnconfigure(2, weight=3)
+        ctk.CTkLabel(frame, text="📈 Live profile", font=("Arial", 16, "bold")).pack(pady=(10, 5))
+        plot_frame = ctk.CTkFrame(frame)
+        plot_frame.pack(fill="both", expand=True, padx=5, pady=5)
+        self.live_plot = live_plot.LivePlot(plot_frame)
+
     # File path selecting display 
     def select_save_path(self):
         path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV File", "*.csv")])
@@ -344,6 +437,7 @@ class App(ctk.CTk):
         if choice == "Continuous":
             self.nb_label.grid_remove()
             self.nb_entry.grid_remove()
+            self.levels_frame.grid_remove()
             self.freq_label.grid()
             self.freq_entry.grid()
         else:
@@ -351,6 +445,7 @@ class App(ctk.CTk):
             self.freq_entry.grid_remove()
             self.nb_label.grid()
             self.nb_entry.grid()
+            self.levels_frame.grid()
 
     def update_fields(self, nb):
         nb = int(nb)
@@ -395,50 +490,51 @@ class App(ctk.CTk):
             self.position3_button.grid()
             
 
-    def wind_selected(self):
-        if self.measure_wind.get() or self.measure_temp.get() or self.measure_press.get():
-            self.seral_port_label.grid()
-            self.seral_port_entry.grid()
-        else:
-            self.seral_port_label.grid_remove()
-            self.seral_port_entry.grid_remove()
+    def sensor_selected(self, name):
+        """Show the settings of the sensor 'name' when one of its channels is recorded"""
+        used = any(self.measure[option].get() for option in sensor_plugins.PLUGINS[name].description.options)
+        for setting_label, setting_entry in self.settings_widgets[name]:
+            if used:
+                setting_label.grid()
+                setting_entry.grid()
+            else:
+                setting_label.grid_remove()
+                setting_entry.grid_remove()
         if self.find_button.cget("state") == "normal":
             self.unconnect()
 
-    def co2_selected(self):
-        if self.measure_co2.get() or self.measure_hum.get() or self.measure_intern_co2.get():
-            self.co2_vendor_label.grid()
-            self.co2_product_label.grid()
-            self.co2_vendor_entry.grid()
-            self.co2_product_entry.grid()
-        else:
-            self.co2_vendor_label.grid_remove()
-            self.co2_product_label.grid_remove()
-            self.co2_vendor_entry.grid_remove()
-            self.co2_product_entry.grid_remove()
+    def options(self):
+        """Channels to record, {option: bool}"""
+        return {option: variable.get() for option, variable in self.measure.items()}
 
-        if self.find_button.cget("state") == "normal":
-            self.unconnect()
+    def set_settings_state(self, state):
+        for widgets in self.settings_widgets.values():
+            for _, setting_entry in widgets:
+                setting_entry.configure(state=state)
+
+    def set_options_state(self, state):
+        for box in self.option_boxes.values():
+            box.configure(state=state)
+        self.raw_box.configure(state=state)
 
     def connect(self):
         self.connected_button.configure(state="disabled")
         self.app_state = "connect"
-        com = self.serial_port.get()
         ip = self.ip_bras.get()
         port = int(self.port_bras.get())
-        vendor = self.co2_vendor_entry.get()
-        product = self.co2_product_entry.get()
-        temp = self.measure_temp.get()
-        pres = self.measure_press.get()
-        wind = self.measure_wind.get()
-        hum = self.measure_hum.get()
-        co2 = self.measure_co2.get()
-        intern_co2 = self.measure_intern_co2.get()
-        self.result = [com, ip, port, vendor, product, temp, pres, wind, hum, co2, intern_co2]
+        settings = {name: {key: variable.get() for key, variable in variables.items()}
+                    for name, variables in self.sensor_settings.items()}
+        self.result = [ip, port, self.options(), settings]
+        self.post("connect", self.result)
         
 
     def unconnect(self):
         self.app_state = "unconnect"
+        self.post("unconnect")
+        self.disconnected()
+
+    def disconnected(self):
+        """Back to the connection settings, after unconnect or when the robot link is lost"""
         self.find_button.configure(state="disabled")
         self.position1_button.configure(state="disabled")
         self.position2_button.configure(state="disabled")
@@ -470,6 +566,7 @@ class App(ctk.CTk):
         else:
             return
         self.result = [distance1, angle1]
+        self.post("goto", self.result)
         
 
     def goto_field2(self):
@@ -483,6 +580,7 @@ class App(ctk.CTk):
         else:
             return
         self.result = [distance2, angle2]
+        self.post("goto", self.result)
         
 
     def goto_field3(self):
@@ -496,6 +594,7 @@ class App(ctk.CTk):
         else:
             return
         self.result = [distance3, angle3]
+        self.post("goto", self.result)
 
     def find_ground(self, i):
         if i == 0:
@@ -524,6 +623,7 @@ class App(ctk.CTk):
             return
         self.app_state = "gotoground"
         self.result = [gposition]
+        self.post("gotoground", self.result)
 
     def save_ground_field(self):
         self.gposition_button.configure(state="disabled")
@@ -534,6 +634,7 @@ class App(ctk.CTk):
             return
         self.app_state = "saveground"
         self.result = [gposition]
+        self.post("saveground", self.result)
 
 
     def finding_ground(self):
@@ -567,9 +668,7 @@ class App(ctk.CTk):
         self.start_button.grid()
         self.start_button.configure(state="disabled")
         self.stop_button.grid()
-        self.co2_product_entry.configure(state="disabled")
-        self.co2_vendor_entry.configure(state="disabled")
-        self.seral_port_entry.configure(state="disabled")
+        self.set_settings_state("disabled")
         self.nb_fields_menu.configure(state="disabled")
         self.ip_entry.configure(state="disabled")
         self.port_entry.configure(state="disabled")
@@ -595,6 +694,7 @@ class App(ctk.CTk):
             self.angle3_input.grid_remove()
             self.angle3_label.grid_remove()
         self.app_state = "find"
+        self.post("find", self.result)
         messagebox.showinfo("Message", "Settings saved.")
         
     def start_recording(self):
@@ -613,25 +713,27 @@ class App(ctk.CTk):
                 return
             freq = 1
         if self.is_number(self.meas_time.get(), "measurement time", 0):
-            pass
+            meas_time = int(self.meas_time.get())
+        else:
+            return
+        if self.is_number(self.nb_passes.get(), "passes per field", 1):
+            nb_passes = int(self.nb_passes.get())
+        else:
+            return
+        if self.is_number(self.dwell.get(), "dwell time", 0):
+            dwell = int(self.dwell.get())
         else:
             return
-        temp = self.measure_temp.get()
-        pres = self.measure_press.get()
-        wind = self.measure_wind.get()
-        hum = self.measure_hum.get()
-        co2 = self.measure_co2.get()
-        intern_co2 = self.measure_intern_co2.get()
-        self.result = [filename, temp, pres, wind, hum, co2, intern_co2, mode, nb_points, freq]
+        spacing = self.spacing.get()
+        self.result = [filename, self.options(), mode, nb_points, freq, meas_time, spacing, nb_passes, dwell,
+                       self.raw_capture.get()]
         self.nb_entry.configure(state="disabled")
         self.freq_entry.configure(state="disabled")
+        self.passes_entry.configure(state="disabled")
+        self.spacing_menu.configure(state="disabled")
+        self.dwell_entry.configure(state="disabled")
         self.csv_button.configure(state="disabled")
-        self.temp_box.configure(state="disabled")
-        self.pres_box.configure(state="disabled")
-        self.co2_box.configure(state="disabled")
-        self.wind_box.configure(state="disabled")
-        self.h2o_box.configure(state="disabled")
-        self.intern_co2_box.configure(state="disabled")
+        self.set_options_state("disabled")
         self.mode_menu.configure(state="disabled")
         self.valid_button.grid()
         self.start_button.grid_remove()
@@ -642,8 +744,17 @@ class App(ctk.CTk):
         if self.finding_ground_label.winfo_ismapped():
             self.finding_ground_label.grid_remove()
         self.app_state = "start"
+        self.post("start", self.result)
         messagebox.showinfo("Message", "Settings saved.")
 
+    def start_live_plot(self, names):
+        if self.live_plot:
+            self.live_plot.start(names)
+
+    def stop_live_plot(self):
+        if self.live_plot:
+            self.live_plot.stop()
+
     def update_counter(self, progress):
         self.progress_bar.set(progress)
         self.progress_text.set(f"{progress * 100:.1f} %")
@@ -655,12 +766,15 @@ class App(ctk.CTk):
                 self.gposition_button.configure(state="disabled")
                 self.gsave_button.configure(state="disabled")
                 self.app_state = "stop_find"
+                self.post("stop_find")
             if self.app_state == "record":
                 self.valid_button.configure(state="disabled")
                 self.app_state = "stop_measure"
+                self.post("stop_measure")
             if self.app_state == "wait":
                 self.start_button.configure(state="disabled")
                 self.app_state = "stop"
+                self.post("stop")
 
     def end_recording(self):
         if self.app_state == "stop_find":
@@ -681,20 +795,15 @@ class App(ctk.CTk):
         self.progress_label.grid_remove()
         self.find_button.grid()
         self.find_button.configure(state="normal")
-        self.co2_product_entry.configure(state="normal")
         self.nb_entry.configure(state="normal")
         self.freq_entry.configure(state="normal")
-        self.co2_vendor_entry.configure(state="normal")
-        self.seral_port_entry.configure(state="normal")
-        self.co2_product_entry.configure(state="normal")
+        self.passes_entry.configure(state="normal")
+        self.spacing_menu.configure(state="normal")
+        self.dwell_entry.configure(state="normal")
+        self.set_settings_state("normal")
         self.csv_button.configure(state="normal")
         self.nb_fields_menu.configure(state="normal")
-        self.temp_box.configure(state="normal")
-        self.co2_box.configure(state="normal")
-        self.wind_box.configure(state="normal")
-        self.h2o_box.configure(state="normal")
-        self.pres_box.configure(state="normal")
-        self.intern_co2_box.configure(state="normal")
+        self.set_options_state("normal")
         self.mode_menu.configure(state="normal")
         self.ip_entry.configure(state="normal")
         self.port_entry.configure(state="normal")
@@ -747,10 +856,23 @@ class App(ctk.CTk):
         else:
             return
         self.result = [meas_time]
+        self.post("update", self.result)
 
     def get_result(self):
         return self.result
+
+    def post(self, command, param=None):
+        """Send a command to the control thread"""
+        self.commands.put((command, param))
     
+    def set_state(self, state):
+        self.app_state = state
+
+    def refresh_state(self):
+        """Blink the state labels and apply the state changes, every second"""
+        self.get_actual_state()
+        self.after(1000, self.refresh_state)
+
     def get_actual_state(self):
         
         if self.app_state == "wait":
@@ -812,6 +934,8 @@ class App(ctk.CTk):
     
     def on_close(self):
         self.app_state = "close"
+        self.ui.close()
+        self.post("close")
         self.destroy()
 
     def connection_error(self):
@@ -821,5 +945,14 @@ class App(ctk.CTk):
     def error_file(self):
         messagebox.showinfo("ERREUR", "Can't open file")
 
-    def saved_file(self, filepath):
-        messagebox.showinfo("FILE SAVED", "File saved here : {0}".format(filepath))
\ No newline at end of file
+    def position_error(self, distance):
+        messagebox.showinfo("ERREUR", "No robot position found for a distance of {0} mm".format(distance))
+
+    def ask_resume(self, filepath):
+        return messagebox.askyesno("Resume", "The recording {0} was interrupted. Do you want to resume it ?".format(filepath))
+
+    def write_error(self, message):
+        messagebox.showinfo("ERREUR", "Can't write the measurements : {0}".format(message))
+
+    def saved_file(self, filepath, report=""):
+        messagebox.showinfo("FILE SAVED", "File saved here : {0}\n\n{1}".format(filepath, report))
\ No newline at end of file
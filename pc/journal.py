@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Write-ahead journal of a recording ('data.csv' -> 'data.journal').
+Every row is appended to the journal before it is queued for the writers, and
+reaches the system by batches (same flush_rows / flush_latency as the writers),
+with checkpoints (field, pass, elapsed measurement time, fields left in the cycle)
+at each field and pass, synced to disk with the rows before them.
+The journal is deleted when the recording ends normally; if it is still there
+at the next start, the process died: replay() rebuilds the recording files
+from it up to the last complete field and returns the checkpoint to resume the
+measurement from; the rows of the unfinished field are dropped, as it is measured again.
+One JSON object per line.
+"""
+
+import json
+import os
+import time
+
+from recording import WRITERS
+
+
+def journal_path(filename):
+    """Journal that goes with the recording 'filename'"""
+    return os.path.splitext(filename)[0] + ".journal"
+
+
+class Journal():
+    """Append-only journal of one recording"""
+
+    def __init__(self, filename, header, formats, resume=False, flush_rows=100, flush_latency=0.5):
+        """
+        Params:\n
+            - 'filename': recording (CSV) file name
+            - 'header': names and units/flags rows of the CSV header
+            - 'formats': recording formats, keys of recording.WRITERS
+            - 'resume': append to the journal of an interrupted recording
+            - 'flush_rows', 'flush_latency': the rows reach the system every 'flush_rows' rows,
+              or with the first row journaled 'flush_latency' (s) after the oldest one not flushed
+        """
+        self.path = journal_path(filename)
+        self.flush_rows = flush_rows
+        self.flush_latency = flush_latency
+        self._nb_pending = 0  # Rows written since the last flush
+        self._deadline = None  # Time at which the oldest of them must be flushed
+        self._file = open(self.path, mode='a' if resume else 'w')
+        if not resume:
+            self._write({"type": "header", "filename": filename, "header": header, "formats": list(formats)})
+            self.sync()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, default=str) + "\n")
+
+    def append(self, row):
+        """Journal one row; a crash of the program loses the rows not flushed yet, as in the CSV file"""
+        self._write({"type": "row", "row": row})
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now + self.flush_latency
+        self._nb_pending += 1
+        if self._nb_pending >= self.flush_rows or now >= self._deadline:
+            self.flush()
+
+    def checkpoint(self, event, field, pass_number, elapsed, remaining=None):
+        """
+        Journal the progress of the measurement and make sure it is on disk.
+        'remaining': indices (from 0) of the fields left in the cycle, in their order
+        """
+        self._write({"type": "checkpoint", "event": event, "field": field, "pass": pass_number, "elapsed": elapsed,
+                     "remaining": remaining})
+        self.sync()
+
+    def flush(self):
+        self._file.flush()
+        self._nb_pending = 0
+        self._deadline = None
+
+    def sync(self):
+        self.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, delete=True):
+        """End of the journal; it is deleted once the recording is complete"""
+        self._file.close()
+        if delete:
+            os.remove(self.path)
+
+
+def read_journal(path):
+    """(header record, rows, last checkpoint or None) of a journal"""
+    header = None
+    rows = []
+    checkpoint = None
+    with open(path) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # Last line cut by the crash
+            if record["type"] == "header":
+                header = record
+            elif record["type"] == "row":
+                rows.append(record["row"])
+            elif record["type"] == "checkpoint":
+                checkpoint = record
+    return header, rows, checkpoint
+
+
+def cut_journal(path):
+    """
+    Drop the records after the last 'field_end' checkpoint of a journal (the rows of the
+    unfinished field), so they are neither replayed now nor after another crash
+    """
+    with open(path) as file:
+        lines = file.readlines()
+    end = 0
+    for i, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break  # Last line cut by the crash
+        if record["type"] == "header" or (record["type"] == "checkpoint" and record["event"] == "field_end"):
+            end = i + 1
+    if end < len(lines):
+        with open(path + ".tmp", "w") as file:
+            file.writelines(lines[:end])
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+
+def interrupted(filename):
+    """True if the recording 'filename' was interrupted and can be resumed"""
+    return os.path.exists(journal_path(filename))
+
+
+def replay(filename):
+    """
+    Rebuild the recording files of 'filename' from its journal, up to the last complete field.
+
+    Return:\n
+        - the last 'field_end' checkpoint ({"event", "field", "pass", "elapsed", "remaining"}), to give to
+          AcquisitionSession.start_recording
+    """
+    cut_journal(journal_path(filename))
+    header, rows, checkpoint = read_journal(journal_path(filename))
+    if checkpoint is None:
+        checkpoint = {"type": "checkpoint", "event": "start", "field": 1, "pass": 0, "elapsed": 0}
+    for name in header["formats"]:
+        writer = WRITERS[name](filename, header["header"])
+        writer.write_rows(rows)
+        writer.close()
+    return checkpoint
+
+
+def resume_fields(checkpoint):
+    """
+    Indices (from 0) of the fields left in the cycle interrupted at 'checkpoint',
+    None to start with a whole cycle (nothing measured yet)
+    """
+    return checkpoint.get("remaining")
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Statistics of the sensors at each level of the Discontinuous mode, accumulated
+while the arm dwells there (the Dwell time must be > 0): count, mean, standard
+deviation, min and max of each channel recorded, and the covariances of
+sensor_config.FLUXES (w'T', w'c'...). Every sample of the sensors is used, not
+only the rows of the recording, and the levels of the same field are accumulated
+over the passes and cycles. The table is rewritten after each level next to the
+recording ('data.csv' -> 'data_levels.csv'), one row per field and level; its
+'Samples' column is 0 for a level where no sample was received.
+"""
+
+import csv
+import os
+import time
+
+import numpy as np
+
+from sensor_config import FLUXES
+from sensors import to_float
+
+LEVEL_COLUMNS = [["Field number", "Depth", "Position", "Dwells", "Dwell time", "Samples"],
+                 ["X", "mm", "mm", "X", "s", "X"]]
+STATISTICS = ["n", "mean", "std", "min", "max"]
+
+
+def levels_path(filename):
+    """Statistics table of the recording 'filename'"""
+    return os.path.splitext(filename)[0] + "_levels.csv"
+
+
+def values_at(times, sample_times, samples, max_staleness=0.5):
+    """Samples of one channel interpolated at 'times', NaN further than 'max_staleness' (s) from any sample"""
+    if len(sample_times) == 0:
+        return np.full(len(times), np.nan)
+    values = np.interp(times, sample_times, samples)
+    k = np.searchsorted(sample_times, times)
+    before = sample_times[np.clip(k - 1, 0, len(sample_times) - 1)]
+    after = sample_times[np.clip(k, 0, len(sample_times) - 1)]
+    values[np.minimum(np.abs(times - before), np.abs(after - times)) > max_staleness] = np.nan
+    return values
+
+
+class RunningStats():
+    """Welford accumulator of each column of the samples, NaN values left out"""
+
+    def __init__(self, nb_columns):
+        self.count = np.zeros(nb_columns, dtype=int)
+        self.mean = np.zeros(nb_columns)
+        self.m2 = np.zeros(nb_columns)  # Sum of the squared deviations from the mean
+        self.min = np.full(nb_columns, np.inf)
+        self.max = np.full(nb_columns, -np.inf)
+
+    def update(self, values, columns=slice(None)):
+        """
+        Add the samples 'values' (one row each) of the columns 'columns', merged as a batch (Chan et al.)
+        """
+        valid = ~np.isnan(values)
+        n = valid.sum(axis=0)
+        if not n.any():
+            return
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, values, 0).sum(axis=0) / n
+            m2 = np.where(valid, values - mean, 0) ** 2
+        has = n > 0
+        count = self.count[columns]
+        total = count + n
+        delta = np.where(has, mean - self.mean[columns], 0)
+        ratio = np.divide(n, total, out=np.zeros(len(n)), where=has)
+        self.m2[columns] += m2.sum(axis=0) + delta ** 2 * count * ratio
+        self.mean[columns] += delta * ratio
+        self.count[columns] = total
+        self.min[columns] = np.minimum(self.min[columns], np.where(valid, values, np.inf).min(axis=0))
+        self.max[columns] = np.maximum(self.max[columns], np.where(valid, values, -np.inf).max(axis=0))
+
+    @property
+    def std(self):
+        """Sample standard deviation, NaN with less than two samples"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def restore(self, i, count, mean, std, minimum, maximum):
+        """Start column 'i' again from the statistics written in a table"""
+        if count > 0:
+            self.count[i] = count
+            self.mean[i] = mean
+            self.m2[i] = std ** 2 * (count - 1) if count > 1 else 0.0
+            self.min[i] = minimum
+            self.max[i] = maximum
+
+
+class RunningCovariance():
+    """Welford co-moment of two channels, with the samples where both are numbers"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.c = 0.0  # Sum of the products of the deviations from the means
+
+    def update(self, x, y):
+        valid = ~(np.isnan(x) | np.isnan(y))
+        n = int(valid.sum())
+        if n == 0:
+            return
+        x, y = x[valid], y[valid]
+        mean_x, mean_y = x.mean(), y.mean()
+        total = self.count + n
+        dx, dy = mean_x - self.mean_x, mean_y - self.mean_y
+        self.c += ((x - mean_x) * (y - mean_y)).sum() + dx * dy * self.count * n / total
+        self.mean_x += dx * n / total
+        self.mean_y += dy * n / total
+        self.count = total
+
+    @property
+    def covariance(self):
+        return self.c / (self.count - 1) if self.count > 1 else np.nan
+
+
+class Level():
+    """Accumulators of one level of one field"""
+
+    def __init__(self, field, depth, position, nb_columns, nb_fluxes):
+        self.field = field
+        self.depth = depth
+        self.position = position
+        self.nb_dwells = 0
+        self.dwell_time = 0.0
+        self.stats = RunningStats(nb_columns)
+        self.fluxes = [RunningCovariance() for _ in range(nb_fluxes)]
+
+    @property
+    def nb_samples(self):
+        """Samples of the channel with the most of them"""
+        return int(self.stats.count.max()) if len(self.stats.count) else 0
+
+
+class LevelStatistics():
+    """Statistics of each level of a Discontinuous recording, fed from the ring buffers of the sensors"""
+
+    def __init__(self, filename, robot, append=False, max_staleness=0.5):
+        """
+        Params:\n
+            - 'robot': connected TCPClient whose recorded channels are used
+            - 'append': start from the table of an interrupted recording
+            - 'max_staleness': a channel of another sensor further than this from a sample
+              is left out of the covariance (s)
+        """
+        self.path = levels_path(filename)
+        self.robot = robot
+        self.max_staleness = max_staleness
+        # (sensor, index in its samples) of each channel; angles have no meaningful arithmetic mean
+        self.columns = [(sensor, i) for sensor in robot.sensors.values()
+                        for i in sensor.description.selected(robot.options) if sensor.channels[i].unit != "deg"]
+        names = [sensor.channels[i].name for sensor, i in self.columns]
+        # Columns of the table and indices in the samples of each sensor
+        self.groups = {}
+        for j, (sensor, i) in enumerate(self.columns):
+            columns, indices = self.groups.setdefault(sensor.name, ([], []))
+            columns.append(j)
+            indices.append(i)
+        self.fluxes = [(self.columns[names.index(x)], self.columns[names.index(y)])
+                       for x, y in FLUXES if x in names and y in names]
+        self.levels = {}  # Level by (field, depth)
+        self._level = None
+        self._start = None
+        self._counts = {}  # Samples of each sensor already accumulated
+        self.error = None  # Last error writing the table, the statistics are kept in memory
+        if append and os.path.exists(self.path):
+            self.load()
+
+    def header(self):
+        """Names and units rows of the table"""
+        names, units = [list(row) for row in LEVEL_COLUMNS]
+        for sensor, i in self.columns:
+            channel = sensor.channels[i]
+            names.extend(f"{channel.name} {statistic}" for statistic in STATISTICS)
+            units.extend(["X"] + [channel.unit] * 4)
+        for x, y in self.fluxes:
+            x, y = x[0].channels[x[1]], y[0].channels[y[1]]
+            names.extend([f"cov({x.name}, {y.name}) n", f"cov({x.name}, {y.name})"])
+            units.extend(["X", f"{x.unit}.{y.unit}"])
+        return [names, units]
+
+    def begin(self, field, depth, position):
+        """The arm arrived at a level: accumulate the samples received from now on"""
+        key = (field, round(depth, 3))
+        if key not in self.levels:
+            self.levels[key] = Level(field, depth, position, len(self.columns), len(self.fluxes))
+        self._level = self.levels[key]
+        self._level.position = position
+        self._start = time.monotonic()
+        self._counts = {sensor.name: sensor.buffer.count for sensor in self.robot.sensors.values()}
+
+    def fold(self):
+        """Accumulate the samples received since the last call"""
+        level = self._level
+        if level is None:
+            return
+        new = {}
+        for sensor in self.robot.sensors.values():
+            times, values, self._counts[sensor.name] = sensor.buffer.since(self._counts[sensor.name])
+            keep = times >= self._start  # Samples of the first read may be dated before the arrival
+            new[sensor.name] = (times[keep], values[keep])
+        for name, (columns, indices) in self.groups.items():
+            values = new[name][1]
+            if len(values):
+                level.stats.update(values[:, indices], columns)
+        for flux, ((sensor_x, i), (sensor_y, k)) in zip(level.fluxes, self.fluxes):
+            times, values = new[sensor_x.name]
+            if sensor_y is sensor_x:
+                y = values[:, k]
+            else:
+                sample_times, samples = sensor_y.buffer.last()
+                y = values_at(times, sample_times, samples[:, k], self.max_staleness)
+            flux.update(values[:, i], y)
+
+    def end(self):
+        """The arm leaves the level: accumulate its last samples and write the table"""
+        if self._level is None:
+            return
+        self.fold()
+        self._level.nb_dwells += 1
+        self._level.dwell_time += time.monotonic() - self._start
+        self._level = None
+        try:
+            self.write()
+        except OSError as e:
+            self.error = str(e)
+
+    def rows(self):
+        """Rows of the table, by field and depth"""
+        rows = []
+        for key in sorted(self.levels):
+            level = self.levels[key]
+            stats = level.stats
+            row = [level.field, level.depth, level.position, level.nb_dwells, level.dwell_time, level.nb_samples]
+            for j in range(len(self.columns)):
+                has = stats.count[j] > 0
+                row.extend([stats.count[j], stats.mean[j] if has else np.nan, stats.std[j],
+                            stats.min[j] if has else np.nan, stats.max[j] if has else np.nan])
+            for flux in level.fluxes:
+                row.extend([flux.count, flux.covariance])
+            rows.append(row)
+        return rows
+
+    def write(self):
+        """Rewrite the table, through a temporary file so a reader never sees it half-written"""
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerows(self.header())
+            writer.writerows([f"{value:.6g}" if isinstance(value, float) else value for value in row]
+                             for row in self.rows())
+        os.replace(temporary, self.path)
+
+    def load(self):
+        """
+        Accumulate on the table of an interrupted recording. The means of the covariances
+        are those of their channels, exact when the channels have the same samples.
+        """
+        with open(self.path, newline="") as file:
+            reader = csv.reader(file)
+            names = next(reader)
+            next(reader)
+            rows = [dict(zip(names, map(to_float, row))) for row in reader]
+        for row in rows:
+            field, depth = int(row["Field number"]), row["Depth"]
+            level = Level(field, depth, row["Position"], len(self.columns), len(self.fluxes))
+            level.nb_dwells = int(row["Dwells"])
+            level.dwell_time = row["Dwell time"]
+            means = {}
+            for j, (sensor, i) in enumerate(self.columns):
+                name = sensor.channels[i].name
+                if f"{name} n" in row:
+                    level.stats.restore(j, *(row[f"{name} {statistic}"] for statistic in STATISTICS))
+                    means[name] = row[f"{name} mean"]
+            for flux, (x, y) in zip(level.fluxes, self.fluxes):
+                x, y = x[0].channels[x[1]].name, y[0].channels[y[1]].name
+                count = row.get(f"cov({x}, {y}) n", 0)
+                if count > 1:
+                    flux.count = int(count)
+                    flux.c = row[f"cov({x}, {y})"] * (count - 1)
+                    flux.mean_x, flux.mean_y = means[x], means[y]
+            self.levels[(field, round(depth, 3))] = level
+
+    def report(self):
+        """Levels and samples accumulated, for the end of a recording"""
+        if not self.levels:
+            return ""
+        counts = [level.nb_samples for level in self.levels.values()]
+        report = (f"Level statistics: {len(self.levels)} levels, {min(counts)} - {max(counts)} samples per level "
+                  f"in {os.path.basename(self.path)}")
+        empty = counts.count(0)
+        if empty:
+            report += f", {empty} levels without any sample"
+        return report + (f" (not written: {self.error})" if self.error else "")
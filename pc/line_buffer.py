@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+"""
+
+
+class LineBuffer():
+    """Persistent receive buffer cutting a byte stream into complete messages"""
+
+    def __init__(self, separator=b"\r", encoding="utf-8"):
+        """
+        Params:\n
+            - 'separator': bytes ending each message (b"\\r" for the robot, b"\\n" for sensors)
+            - 'encoding': encoding used to decode the messages
+        """
+        self.separator = separator
+        self.encoding = encoding
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Append received bytes and return every complete message, in order.
+        An unterminated message is kept until the rest of it is received.
+        """
+        messages = []
+        for line in self.feed_raw(data):
+            line = line.decode(self.encoding, errors="ignore").strip()
+            if line:
+                messages.append(line)
+        return messages
+
+    def feed_raw(self, data):
+        """Like feed() but the complete messages are returned as bytes, neither decoded nor stripped"""
+        self._buffer += data
+        end = self._buffer.rfind(self.separator)
+        if end < 0:
+            return []
+        complete = bytes(self._buffer[:end])
+        del self._buffer[:end + len(self.separator)]
+        return complete.split(self.separator)
+
+    def pending(self):
+        """Number of bytes waiting for the end of their message"""
+        return len(self._buffer)
+
+    def clear(self):
+        """Drop the incomplete message, if any"""
+        self._buffer.clear()
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Live plot of the vertical profile of the current field: one panel per sensor
+channel, value against position Z. The acquisition puts its rows and markers
+in a queue (rows are dropped when the plot lags behind, never the markers
+nor the recording, see session.LiveQueue); the Tk thread drains it a few times per second.
+Long series are reduced to the min and max of each bucket of samples,
+and only the lines are redrawn over a saved background (blitting).
+"""
+
+import math
+import queue
+
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+from session import LiveQueue, Marker
+
+
+def minmax_decimate(values, nb_buckets):
+    """
+    Indices of the samples kept to draw 'values': the min and the max
+    of each of 'nb_buckets' buckets of consecutive samples, in order.
+    NaN are ignored; a bucket of NaN keeps its first sample so the gap is drawn.
+    """
+    n = len(values)
+    if n <= 2 * nb_buckets:
+        return np.arange(n)
+    size = math.ceil(n / nb_buckets)
+    padded = np.full(size * nb_buckets, np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(nb_buckets, size)
+    valid = ~np.isnan(buckets)
+    starts = np.arange(nb_buckets) * size
+    low = np.where(valid, buckets, np.inf).argmin(axis=1)
+    high = np.where(valid, buckets, -np.inf).argmax(axis=1)
+    indices = np.sort(np.concatenate([starts + low, starts + high]))
+    return np.unique(indices[indices < n])
+
+
+class LivePlot():
+    """Panels of the sensor channels of the current field, embedded in a Tk frame"""
+
+    def __init__(self, parent, queue_size=5000, refresh_period=200, nb_buckets=300):
+        """
+        Params:\n
+            - 'parent': Tk frame of the plot
+            - 'queue_size': rows waiting for the plot, the next ones are dropped (not the markers)
+            - 'refresh_period': time between two drawings (ms)
+            - 'nb_buckets': buckets of the min/max decimation, about the height of a panel in pixels
+        """
+        self.parent = parent
+        self.rows = LiveQueue(queue_size)  # Rows and markers put by the acquisition
+        self.refresh_period = refresh_period
+        self.nb_buckets = nb_buckets
+        self.channels = []
+        self.field = 0
+        self._positions = []
+        self._values = []
+        self._running = False
+        self._background = None
+        self._limits_changed = True
+
+        self.figure = Figure(figsize=(5, 4), dpi=80)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=parent)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        self.canvas.mpl_connect("draw_event", self._save_background)
+        self.axes = []
+        self.lines = []
+        self.labels = []
+
+    def start(self, names):
+        """Plot the channels of a recording whose header names are 'names'"""
+        end = names.index('Mode') if 'Mode' in names else len(names)
+        self.channels = names[3:end]
+        self._clear_field(0)
+        self.figure.clear()
+        self.axes, self.lines, self.labels = [], [], []
+        nb = max(len(self.channels), 1)
+        for i, name in enumerate(self.channels):
+            ax = self.figure.add_subplot(1, nb, i + 1)
+            ax.set_title(name, fontsize=9)
+            ax.tick_params(labelsize=7)
+            if i == 0:
+                ax.set_ylabel("Position Z (mm)", fontsize=8)
+            line, = ax.plot([], [], linewidth=0.8, animated=True)
+            label = ax.text(0.5, 0.98, "", transform=ax.transAxes, ha="center", va="top",
+                            color="red", fontsize=8, animated=True)
+            self.axes.append(ax)
+            self.lines.append(line)
+            self.labels.append(label)
+        self.figure.tight_layout()
+        self._limits_changed = True
+        if not self._running:
+            self._running = True
+            self.parent.after(self.refresh_period, self._refresh)
+
+    def stop(self):
+        """Stop drawing at the end of the recording, the last profile stays on screen"""
+        self._running = False
+
+    def _clear_field(self, field):
+        self.field = field
+        self._positions = []
+        self._values = []
+
+    def _drain(self):
+        """Take the queued rows; True if anything changed"""
+        changed = False
+        while True:
+            try:
+                item = self.rows.get_nowait()
+            except queue.Empty:
+                return changed
+            if isinstance(item, Marker):
+                if item.name == "field_start":
+                    self._clear_field(item.field)
+                    self._limits_changed = True
+                    changed = True
+                continue
+            self._positions.append(item[1])
+            self._values.append(item[3:3 + len(self.channels)])
+            changed = True
+
+    def _refresh(self):
+        if not self._running:
+            return
+        try:
+            if self._drain() and self.channels:
+                self._draw()
+        finally:
+            self.parent.after(self.refresh_period, self._refresh)
+
+    def _draw(self):
+        positions = np.array(self._positions, dtype=float)
+        values = np.array(self._values, dtype=float).reshape(len(positions), -1)
+        for i, (ax, line, label) in enumerate(zip(self.axes, self.lines, self.labels)):
+            column = values[:, i]
+            kept = minmax_decimate(column, self.nb_buckets)
+            line.set_data(column[kept], positions[kept])
+            label.set_text("Error" if len(column) and np.isnan(column[-1]) else "")
+            if self._outside(ax, column, positions):
+                self._limits_changed = True
+
+        if self._limits_changed:
+            # New axis limits: full drawing, the background is saved by _save_background
+            for i, ax in enumerate(self.axes):
+                self._set_limits(ax, values[:, i], positions)
+            self._limits_changed = False
+            self.canvas.draw()
+            return
+        if self._background is None:
+            return
+        self.canvas.restore_region(self._background)
+        for ax, line, label in zip(self.axes, self.lines, self.labels):
+            ax.draw_artist(line)
+            ax.draw_artist(label)
+        self.canvas.blit(self.figure.bbox)
+
+    def _save_background(self, event):
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for ax, line, label in zip(self.axes, self.lines, self.labels):
+            ax.draw_artist(line)
+            ax.draw_artist(label)
+
+    @staticmethod
+    def _outside(ax, column, positions):
+        if not np.isfinite(column).any():
+            return False
+        xmin, xmax = ax.get_xlim()
+        ymin, ymax = ax.get_ylim()
+        return (np.nanmin(column) < xmin or np.nanmax(column) > xmax
+                or positions.min() < ymin or positions.max() > ymax)
+
+    @staticmethod
+    def _set_limits(ax, column, positions):
+        """Limits with a margin, so they don't change at every new sample"""
+        for values, setter in ((column, ax.set_xlim), (positions, ax.set_ylim)):
+            values = values[np.isfinite(values)]
+            if not len(values):
+                continue
+            low, high = values.min(), values.max()
+            margin = max((high - low) * 0.2, abs(high) * 0.01, 1e-3)
+            setter(low - margin, high + margin)
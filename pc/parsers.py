@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Parsing of the lines sent by the sensors. The fields to read in a line are given
+once, as indices in the split line; every read drains all the complete lines
+received and converts them together to a NumPy array of floats, NaN for a value
+that is not a number.
+"""
+
+import operator
+
+import numpy as np
+
+from line_buffer import LineBuffer
+from sensors import to_float
+
+
+class LineParser():
+    """Values of the lines of one sensor"""
+
+    def __init__(self, fields, delimiter=None, separator=b"\n", min_fields=None):
+        """
+        Params:\n
+            - 'fields': index of each value in the split line, in the order of the values
+            - 'delimiter': bytes between the fields of a line, None for any whitespace
+            - 'separator': bytes ending each line
+            - 'min_fields': fields of a complete line, shorter lines are ignored
+              (answers to the init command, lines cut at connection); by default up to the last field read
+        """
+        self.delimiter = delimiter
+        self.buffer = LineBuffer(separator)
+        self.compile(fields, min_fields)
+        self.nb_lines = 0  # Lines parsed since the start
+        self.nb_ignored = 0  # Incomplete lines among them
+
+    def compile(self, fields, min_fields=None):
+        """Read the values at the indices 'fields' of the split lines from now on"""
+        self.fields = list(fields)
+        self.min_fields = max(self.fields) + 1 if min_fields is None else min_fields
+        # Tuple of the fields read, even when there is only one
+        pick = operator.itemgetter(*self.fields)
+        self._pick = pick if len(self.fields) > 1 else lambda tokens: (pick(tokens),)
+
+    @property
+    def nb_values(self):
+        return len(self.fields)
+
+    def parse_lines(self, lines):
+        """
+        Values of 'lines' (bytes or str), one row per complete line.
+        Returns a (number of complete lines, nb_values) float array.
+        """
+        rows = []
+        for line in lines:
+            tokens = line.strip().split(self.delimiter)
+            if len(tokens) >= self.min_fields:
+                rows.append(self._pick(tokens))
+        return self._to_array(rows, len(lines))
+
+    def _to_array(self, rows, nb_lines):
+        """Float array of the fields read in 'nb_lines' lines"""
+        self.nb_lines += nb_lines
+        self.nb_ignored += nb_lines - len(rows)
+        if not rows:
+            return np.empty((0, self.nb_values))
+        try:
+            return np.array(rows, dtype=float)
+        except ValueError:
+            # Some value is not a number: rows one at a time, values one at a time in the bad rows only
+            values = np.empty((len(rows), self.nb_values))
+            for i, row in enumerate(rows):
+                try:
+                    values[i] = row
+                except ValueError:
+                    values[i] = [to_float(value) for value in row]
+            return values
+
+    def parse(self, line):
+        """Values of one line, all NaN if the line is incomplete"""
+        values = self.parse_lines([line])
+        return values[0] if len(values) else np.full(self.nb_values, np.nan)
+
+    def feed(self, data):
+        """Values of every line completed by the bytes 'data', see parse_lines()"""
+        return self.parse_lines([line for line in self.buffer.feed_raw(data) if line.strip()])
+
+    def clear(self):
+        """Drop the incomplete line, if any"""
+        self.buffer.clear()
+
+
+class LabelledParser(LineParser):
+    """
+    Lines where each value follows its label ('U 1.50 V -0.50 W 0.00 T 21.00 ...').
+    The values are found by their label: the indices are learnt from the first line
+    and learnt again whenever the labels move (other firmware or settings of the sensor).
+    """
+
+    def __init__(self, labels, delimiter=None, separator=b"\n"):
+        """
+        Params:\n
+            - 'labels': label of each value, in the order of the values
+            - 'delimiter', 'separator': see LineParser
+        """
+        self.labels = tuple(label.encode() if isinstance(label, str) else label for label in labels)
+        self.nb_layouts = 0  # Layouts learnt since the start
+        # Until a line is seen, expect the labels in their order, each followed by its value
+        super().__init__(range(1, 2 * len(self.labels), 2), delimiter, separator)
+
+    def compile(self, fields, min_fields=None):
+        super().compile(fields, min_fields)
+        labels = operator.itemgetter(*[i - 1 for i in self.fields])
+        self._labels = labels if len(self.fields) > 1 else lambda tokens: (labels(tokens),)
+
+    def learn(self, tokens):
+        """Find the labels in the split line 'tokens', False if one is missing"""
+        fields = []
+        for label in self.labels:
+            if label not in tokens[:-1]:
+                return False
+            fields.append(tokens.index(label) + 1)
+        self.compile(fields)
+        self.nb_layouts += 1
+        return True
+
+    def parse_lines(self, lines):
+        """Values of 'lines' (bytes), one row per line holding every label, see LineParser.parse_lines()"""
+        rows = []
+        for line in lines:
+            tokens = line.strip().split(self.delimiter)
+            if len(tokens) < self.min_fields or self._labels(tokens) != self.labels:
+                if not self.learn(tokens):
+                    continue
+            rows.append(self._pick(tokens))
+        return self._to_array(rows, len(lines))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+"""
+
+import csv
+from bisect import bisect_left
+
+import numpy as np
+
+
+class PositionNotFound(ValueError):
+    """No joint pose of the table is close enough to the asked distance"""
+
+
+class PositionTable():
+    """
+    Joint poses of max_positions.csv indexed by their distance TY.
+    The file is read once; lookups are a bisection on the sorted TY column.
+    """
+
+    def __init__(self, csv_file):
+        """Read 'csv_file' (columns JP 1 ... JP 6, TY); rows that can't be read are skipped"""
+        self.csv_file = csv_file
+        rows = []
+        with open(csv_file, newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            column_names = next(reader)
+            try:
+                index_ty = column_names.index('TY')
+            except ValueError:
+                raise PositionNotFound(f"No 'TY' column in {csv_file}")
+            for line in reader:
+                try:
+                    rows.append((float(line[index_ty]), list(map(float, line[:6]))))
+                except (ValueError, IndexError):
+                    continue
+        if not rows:
+            raise PositionNotFound(f"No position in {csv_file}")
+        rows.sort(key=lambda row: row[0])
+        self.ty = np.array([row[0] for row in rows])
+        self.poses = np.array([row[1] for row in rows])
+        self._ty_list = self.ty.tolist()  # bisect is faster on a list than on an array
+
+    def nearest(self, distance, tolerance=50):
+        """
+        Joint pose whose TY is the closest to 'distance'.
+        Raise PositionNotFound if it is further than 'tolerance' (mm).
+        """
+        i = bisect_left(self._ty_list, distance)
+        candidates = [k for k in (i - 1, i) if 0 <= k < len(self._ty_list)]
+        best = min(candidates, key=lambda k: abs(self._ty_list[k] - distance))
+        if abs(self._ty_list[best] - distance) > tolerance:
+            raise PositionNotFound(f"No position within {tolerance} mm of {distance} mm")
+        return self.poses[best].tolist()
+
+    def interpolate(self, distance):
+        """
+        Joint pose at 'distance', linearly interpolated between the two surrounding rows.
+        Raise PositionNotFound outside of the table.
+        """
+        if not self._ty_list[0] <= distance <= self._ty_list[-1]:
+            raise PositionNotFound(f"{distance} mm is outside of the table "
+                                   f"({self._ty_list[0]} - {self._ty_list[-1]} mm)")
+        i = bisect_left(self._ty_list, distance)
+        if self._ty_list[i] == distance:
+            return self.poses[i].tolist()
+        fraction = (distance - self._ty_list[i - 1]) / (self._ty_list[i] - self._ty_list[i - 1])
+        return (self.poses[i - 1] + (self.poses[i] - self.poses[i - 1]) * fraction).tolist()
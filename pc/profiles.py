@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Vertical profiles of recordings: the rows of one or several CSV files are binned
+by field and position on a height grid, and the mean, standard deviation and
+standard error of each sensor column are written per field and height bin;
+the angles ("deg" columns, Magnetic) have no meaningful arithmetic mean and are left out.
+The files are read in chunks of lines whose values and timestamps are converted
+with NumPy all at once, and the bins are accumulated (Welford) chunk after chunk,
+so the memory used does not depend on the size of the recordings.
+    python profiles.py data.csv [more.csv ...] --step 20 -o profiles.csv
+A binary recording is converted to CSV first with recording.py.
+"""
+
+import argparse
+import csv
+import io
+import os
+
+import numpy as np
+
+DATA_COLUMNS = 3  # Time, Position, Field number, then the sensor columns
+PROFILE_COLUMNS = [["Field number", "Position", "Rows"], ["X", "mm", "X"]]
+STATISTICS = ["mean", "std", "sem", "n"]
+
+
+def read_header(path):
+    """Names and units/flags rows of a recording"""
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        return [next(reader), next(reader)]
+
+
+def parse_lines(lines, nb_columns):
+    """
+    Timestamps (datetime64[ms]) and values (float, NaN for "Error") of the CSV lines 'lines' (bytes)
+    of a recording with 'nb_columns' data columns; lines without every column are left out.
+    """
+    lines = [line for line in lines if line.count(b",") == nb_columns - 1]
+    if not lines:
+        return np.empty(0, dtype="datetime64[ms]"), np.empty((0, nb_columns - 1))
+    data = b"".join(lines).replace(b"Error", b"nan")
+    times = np.loadtxt(io.BytesIO(data), delimiter=",", usecols=0, dtype="S32", ndmin=1).astype("datetime64[ms]")
+    values = np.loadtxt(io.BytesIO(data), delimiter=",", usecols=range(1, nb_columns), ndmin=2)
+    return times, values
+
+
+def read_chunks(path, chunk_bytes=32 * 2 ** 20):
+    """
+    Read a recording about 'chunk_bytes' at a time.
+    Yield (timestamps, values) of each chunk, the values being the columns of the header
+    after Time (Position, Field number and the sensor columns), see parse_lines().
+    """
+    with open(path, "rb") as file:
+        file.readline()
+        file.readline()
+        nb_columns = None
+        while True:
+            lines = file.readlines(chunk_bytes)
+            if not lines:
+                return
+            if nb_columns is None:
+                # The metadata columns of the header (Mode, Frequency...) have no value in the rows
+                nb_columns = lines[0].count(b",") + 1
+            yield parse_lines(lines, nb_columns)
+
+
+def load_recording(path):
+    """Header, timestamps and values of a whole recording, see read_chunks()"""
+    header = read_header(path)
+    chunks = list(read_chunks(path))
+    if not chunks:
+        return header, np.empty(0, dtype="datetime64[ms]"), np.empty((0, 0))
+    return header, np.concatenate([times for times, _ in chunks]), np.concatenate([values for _, values in chunks])
+
+
+class ProfileGrid():
+    """Rows of recordings accumulated by field and height bin"""
+
+    def __init__(self, step=10.0, origin=0.0, edges=None):
+        """
+        Params:\n
+            - 'step', 'origin': height of the bins and position of one of their edges (mm)
+            - 'edges': increasing edges of the bins (mm), instead of 'step' and 'origin';
+              rows outside are left out
+        """
+        self.step = step
+        self.origin = origin
+        self.edges = None if edges is None else np.asarray(edges, dtype=float)
+        self.keys = {}  # Row of the accumulators of each (field, bin)
+        self.units = {}  # Unit of each channel, in the order of the output columns
+        self.nb_rows = np.zeros(0, dtype=int)
+        self.count = {}  # Per channel, one value per (field, bin)
+        self.mean = {}
+        self.m2 = {}
+        self.nb_outside = 0  # Rows without a valid position or field, or outside the edges
+
+    def bins(self, positions):
+        """Bin of each position, -1 outside the edges"""
+        if self.edges is None:
+            return np.floor((positions - self.origin) / self.step).astype(int)
+        k = np.searchsorted(self.edges, positions, side="right") - 1
+        return np.where((k >= 0) & (k < len(self.edges) - 1), k, -1)
+
+    def centre(self, k):
+        """Position of the middle of bin 'k'"""
+        if self.edges is None:
+            return self.origin + (k + 0.5) * self.step
+        return (self.edges[k] + self.edges[k + 1]) / 2
+
+    def add(self, header, values):
+        """
+        Accumulate rows of a recording.
+
+        Params:\n
+            - 'header': names and units rows of the recording
+            - 'values': Position, Field number and sensor values of each row (see read_chunks())
+        """
+        positions, fields = values[:, 0], values[:, 1]
+        valid = ~np.isnan(positions) & ~np.isnan(fields)
+        bins = np.full(len(values), -1)
+        bins[valid] = self.bins(positions[valid])
+        if self.edges is None:
+            inside = valid
+        else:
+            inside = valid & (bins >= 0)
+        self.nb_outside += int(len(values) - inside.sum())
+        if not inside.any():
+            return
+        keys, rows = np.unique(np.column_stack([fields[inside], bins[inside]]).astype(int), axis=0, return_inverse=True)
+        rows = np.array([self.row((field, k)) for field, k in keys])[rows.ravel()]
+        self.nb_rows += np.bincount(rows, minlength=len(self.nb_rows))
+
+        names, units = header
+        for j in range(DATA_COLUMNS, DATA_COLUMNS + values.shape[1] - 2):
+            if units[j] == "deg":
+                continue
+            self.units.setdefault(names[j], units[j])
+            self.add_channel(names[j], rows, values[inside, j - 1])
+
+    def row(self, key):
+        """Row of the accumulators of 'key', added if new"""
+        if key not in self.keys:
+            self.keys[key] = len(self.keys)
+            self.nb_rows = np.append(self.nb_rows, 0)
+            for name in self.count:
+                self.count[name] = np.append(self.count[name], 0)
+                self.mean[name] = np.append(self.mean[name], 0.0)
+                self.m2[name] = np.append(self.m2[name], 0.0)
+        return self.keys[key]
+
+    def add_channel(self, name, rows, values):
+        """Merge the 'values' of channel 'name' into the bins 'rows' (Chan et al.)"""
+        size = len(self.keys)
+        if name not in self.count:
+            self.count[name] = np.zeros(size, dtype=int)
+            self.mean[name] = np.zeros(size)
+            self.m2[name] = np.zeros(size)
+        valid = ~np.isnan(values)
+        rows, values = rows[valid], values[valid]
+        n = np.bincount(rows, minlength=size)
+        has = n > 0
+        mean = np.divide(np.bincount(rows, values, minlength=size), n, out=np.zeros(size), where=has)
+        m2 = np.bincount(rows, (values - mean[rows]) ** 2, minlength=size)
+        count = self.count[name]
+        total = count + n
+        delta = mean - self.mean[name]
+        ratio = np.divide(n, total, out=np.zeros(size), where=has)
+        self.m2[name] += m2 + delta ** 2 * count * ratio
+        self.mean[name] += delta * ratio
+        self.count[name] = total
+
+    def add_file(self, path, chunk_bytes=32 * 2 ** 20, start=None, end=None):
+        """
+        Accumulate a recording, read in chunks (see read_chunks());
+        only the rows from 'start' to 'end' (numpy.datetime64, local time) when given
+        """
+        header = read_header(path)
+        for times, values in read_chunks(path, chunk_bytes):
+            if start is not None or end is not None:
+                keep = np.ones(len(times), dtype=bool)
+                if start is not None:
+                    keep &= times >= start
+                if end is not None:
+                    keep &= times <= end
+                values = values[keep]
+            if len(values):
+                self.add(header, values)
+
+    def header(self):
+        names, units = [list(row) for row in PROFILE_COLUMNS]
+        for name, unit in self.units.items():
+            names.extend(f"{name} {statistic}" for statistic in STATISTICS)
+            units.extend([unit] * 3 + ["X"])
+        return [names, units]
+
+    def rows(self):
+        """
+        One row per field and bin, by field and position: the mean of each channel,
+        its standard deviation and the standard error of the mean (std / sqrt(n)).
+        The rows follow each other at the acquisition frequency and are not independent:
+        the standard error is a lower bound of the uncertainty.
+        """
+        rows = []
+        for (field, k), i in sorted(self.keys.items()):
+            row = [field, self.centre(k), int(self.nb_rows[i])]
+            for name in self.units:
+                n = self.count[name][i]
+                std = np.sqrt(self.m2[name][i] / (n - 1)) if n > 1 else np.nan
+                row.extend([self.mean[name][i] if n else np.nan, std, std / np.sqrt(n) if n > 1 else np.nan, n])
+            rows.append(row)
+        return rows
+
+    def write(self, path):
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerows(self.header())
+            writer.writerows([f"{value:.6g}" if isinstance(value, float) else value for value in row]
+                             for row in self.rows())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mean vertical profiles of recordings, per field")
+    parser.add_argument("filenames", nargs="+", help="CSV files of the recordings")
+    parser.add_argument("-o", "--output", help="CSV file of the profiles (default: first file + '_profiles.csv')")
+    parser.add_argument("--step", type=float, default=10.0, help="height of the bins (mm)")
+    parser.add_argument("--origin", type=float, default=0.0, help="position of an edge of the bins (mm)")
+    parser.add_argument("--edges", type=float, nargs="+", help="edges of the bins (mm), instead of --step")
+    parser.add_argument("--start", help="first time used, 'YYYY-mm-dd HH:MM:SS'")
+    parser.add_argument("--end", help="last time used, 'YYYY-mm-dd HH:MM:SS'")
+    parser.add_argument("--chunk-mb", type=float, default=32, help="size of the chunks read (MB)")
+    args = parser.parse_args()
+
+    grid = ProfileGrid(args.step, args.origin, sorted(args.edges) if args.edges else None)
+    start = np.datetime64(args.start, "ms") if args.start else None
+    end = np.datetime64(args.end, "ms") if args.end else None
+    for filename in args.filenames:
+        grid.add_file(filename, int(args.chunk_mb * 2 ** 20), start, end)
+    output = args.output or os.path.splitext(args.filenames[0])[0] + "_profiles.csv"
+    grid.write(output)
+    print(f"{len(grid.keys)} bins of {len(set(field for field, _ in grid.keys))} fields from "
+          f"{int(grid.nb_rows.sum())} rows ({grid.nb_outside} left out) in {output}")
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Raw capture: every sample of each sensor at its native rate, and every position
+received from the robot, each in its own CSV file next to the recording
+('data.csv' -> 'data_wind_raw.csv', 'data_co2_raw.csv', 'data_positions_raw.csv').
+Times are seconds since the epoch. At the end of the recording the robot position
+is interpolated at the time of each sensor sample and added to the sensor files.
+To do it again on the files of an interrupted recording:
+    python raw_capture.py data.csv
+"""
+
+import argparse
+import csv
+import glob
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from sensors import to_float
+
+POSITIONS = "positions"
+POSITION_COLUMNS = [["Time", "Position", "Field number"], ["s", "mm", "X"]]
+
+
+def raw_path(filename, stream):
+    """Raw file of the stream 'stream' (sensor name or POSITIONS) of the recording 'filename'"""
+    return os.path.splitext(filename)[0] + f"_{stream}_raw.csv"
+
+
+def read_header(path):
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        return [next(reader), next(reader)]
+
+
+def interpolate_positions(times, position_times, positions, fields, max_gap=0.5):
+    """
+    Position and field number of the robot at 'times', interpolated between the
+    positions received; NaN where no position was received within 'max_gap' (s)
+    on both sides (transits between fields, interruptions of the stream)
+    """
+    z = np.full(len(times), np.nan)
+    field = np.full(len(times), np.nan)
+    if len(position_times) == 0:
+        return z, field
+    n = len(position_times)
+    k = np.searchsorted(position_times, times, side="right")  # First position after each time
+    before = np.clip(k - 1, 0, n - 1)
+    after = np.clip(k, 0, n - 1)
+    close_before = (k > 0) & (times - position_times[before] <= max_gap)
+    close_after = (k < n) & (position_times[after] - times <= max_gap)
+    valid = close_before & (close_after | (position_times[before] == times))
+    z[valid] = np.interp(times[valid], position_times, positions)
+    field[valid] = fields[before[valid]]
+    return z, field
+
+
+def add_positions(filename, max_gap=0.5):
+    """
+    Add the robot position to the raw sensor files of the recording 'filename'.
+    Return the fraction of the sensor samples of each file that have a position.
+    """
+    positions_file = raw_path(filename, POSITIONS)
+    if not os.path.exists(positions_file):
+        return {}
+    positions = np.loadtxt(positions_file, delimiter=",", skiprows=2, ndmin=2)
+    if len(positions):
+        positions = positions[np.argsort(positions[:, 0], kind="stable")]
+    else:
+        positions = np.empty((0, 3))
+
+    coverage = {}
+    for path in sorted(glob.glob(raw_path(filename, "*"))):
+        if path == positions_file:
+            continue
+        names, units = read_header(path)
+        if "Position" in names:
+            continue  # Done already
+        samples = np.loadtxt(path, delimiter=",", skiprows=2, ndmin=2)
+        if len(samples) == 0:
+            samples = np.empty((0, len(names)))
+        z, field = interpolate_positions(samples[:, 0], positions[:, 0], positions[:, 1], positions[:, 2], max_gap)
+        temporary = path + ".tmp"
+        with open(temporary, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(names[:1] + POSITION_COLUMNS[0][1:] + names[1:])
+            writer.writerow(units[:1] + POSITION_COLUMNS[1][1:] + units[1:])
+            np.savetxt(file, np.column_stack([samples[:, :1], z, field, samples[:, 1:]]),
+                       fmt=["%.6f", "%.3f", "%.0f"] + ["%.6g"] * (samples.shape[1] - 1), delimiter=",")
+        os.replace(temporary, path)
+        coverage[os.path.basename(path)] = float(np.mean(~np.isnan(z))) if len(z) else 0.0
+    return coverage
+
+
+class RawCapture():
+    """Writer of the raw files of one recording, fed by the sensor plugins and the robot link"""
+
+    def __init__(self, filename, robot, append=False, flush_latency=0.5, max_gap=0.5):
+        """
+        Create the raw files (raise IOError if one can't be created).
+
+        Params:\n
+            - 'robot': connected TCPClient whose sensors and positions are recorded
+            - 'append': add the samples to the files of an interrupted recording
+            - 'flush_latency': longest time a sample waits before being written (s)
+            - 'max_gap': see add_positions()
+        """
+        self.filename = filename
+        self.robot = robot
+        self.flush_latency = flush_latency
+        self.max_gap = max_gap
+        self.coverage = {}  # Fraction of the samples of each sensor file with a position, see add_positions()
+        self.nb_samples = {}
+        self._files = {}
+        self._formats = {}
+        self._offset = time.time() - time.monotonic()  # Epoch time = time.monotonic() + offset
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start = None
+        self._end = None
+
+        headers = {name: [["Time"] + [channel.name for channel in sensor.channels],
+                          ["s"] + [channel.unit for channel in sensor.channels]]
+                   for name, sensor in robot.sensors.items()}
+        headers[POSITIONS] = POSITION_COLUMNS
+        for stream, header in headers.items():
+            path = raw_path(filename, stream)
+            append_file = append and os.path.exists(path)
+            file = open(path, "a" if append_file else "w", newline="")
+            if not append_file:
+                csv.writer(file).writerows(header)
+            self._files[stream] = file
+            self._formats[stream] = ["%.6f"] + ["%.6g"] * (len(header[0]) - 1)
+            self.nb_samples[stream] = 0
+
+    def start(self):
+        """Record from now on"""
+        self._start = time.monotonic()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+        for sensor in self.robot.sensors.values():
+            sensor.raw = self.add
+        self.robot.link.subscribe(self.add_position)
+
+    def add(self, stream, times, values):
+        """Queue the samples 'values' of 'stream' taken at time.monotonic() 'times'"""
+        self._queue.put((stream, times, values))
+
+    def add_position(self, recv_time, message):
+        """Queue a 'posx,x,y,z,...' message of the robot (called in the event loop of the link)"""
+        z = to_float(message.split(",")[3])
+        self.add(POSITIONS, np.array([recv_time]), np.array([[z, self.robot.nb_actual_field]]))
+
+    def stop(self):
+        """Write the remaining samples, close the files and add the robot position to the sensor files"""
+        self.robot.link.unsubscribe(self.add_position)
+        for sensor in self.robot.sensors.values():
+            sensor.raw = None
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        for file in self._files.values():
+            file.close()
+        self._end = time.monotonic()
+        self.coverage = add_positions(self.filename, self.max_gap)
+
+    def report(self):
+        """Samples recorded per stream and their rate, for the end of a recording"""
+        duration = (self._end or time.monotonic()) - self._start if self._start else 0
+        streams = [f"{stream} {count} ({count / duration if duration else 0:.1f} Hz)"
+                   for stream, count in self.nb_samples.items()]
+        positioned = [f"{name} {fraction * 100:.0f} %" for name, fraction in self.coverage.items()]
+        return "Raw capture: " + ", ".join(streams) + "; samples with a position: " + ", ".join(positioned)
+
+    def _write(self):
+        dirty = False
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                stream, times, values = item
+                np.savetxt(self._files[stream], np.column_stack([np.asarray(times) + self._offset, values]),
+                           fmt=self._formats[stream], delimiter=",")
+                self.nb_samples[stream] += len(times)
+                if not dirty:
+                    dirty = True
+                    deadline = time.monotonic() + self.flush_latency
+            if dirty and time.monotonic() >= deadline:
+                for file in self._files.values():
+                    file.flush()
+                dirty = False
+                deadline = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the robot position to the raw sensor files of a recording")
+    parser.add_argument("filename", help="CSV file of the recording")
+    parser.add_argument("--max-gap", type=float, default=0.5,
+                        help="no position when none was received within this time of a sample (s)")
+    args = parser.parse_args()
+    for name, fraction in add_positions(args.filename, args.max_gap).items():
+        print(f"{name}: position for {fraction * 100:.1f} % of the samples")
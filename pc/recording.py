@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Writers of the measurement rows. A row is
+    [time (int, ns since epoch), position Z (float), field number (int), sensor values (float, NaN if invalid)]
+and the header is the two rows built by main_program (names, then units/flags),
+ending with the metadata columns ('Mode', 'Frequency' or 'Number of points').
+
+The binary recording is a directory next to the CSV file ('data.csv' -> 'data.npzd')
+holding 'metadata.json' and one 'chunk_XXXXXX.npz' per block of rows, one typed array per column.
+Convert it to the CSV layout with:
+    python recording.py data.npzd data.csv
+"""
+
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+
+
+def format_time(time_ns):
+    """Timestamp of the CSV file, to the centisecond"""
+    now = datetime.fromtimestamp(time_ns / 1e9)
+    return now.strftime('%Y-%m-%d %H:%M:%S') + f".{int(now.microsecond/10000):02d}" #convert microsecond to centisecond
+
+
+def format_row(row):
+    """Row as written in the CSV file, "Error" for the invalid values"""
+    cells = [format_time(row[0]), row[1], row[2]]
+    cells.extend("Error" if isinstance(value, float) and math.isnan(value) else value for value in row[3:])
+    return cells
+
+
+def binary_path(filename):
+    """Directory of the binary recording that goes with 'filename'"""
+    return os.path.splitext(filename)[0] + ".npzd"
+
+
+class CsvWriter():
+    """Rows appended to the CSV file, kept open for the whole recording"""
+
+    def __init__(self, filename, header, append=False):
+        """
+        Create the file and write the two header rows (raise IOError if it can't be opened).
+        With 'append', rows are added to an existing recording.
+        """
+        self.filename = filename
+        self._file = open(filename, mode='a' if append else 'w', newline='')
+        self._writer = csv.writer(self._file)
+        if not append:
+            self._writer.writerows(header)
+            self.sync()
+
+    def write_rows(self, rows):
+        self._writer.writerows(format_row(row) for row in rows)
+
+    def flush(self):
+        """Hand the written rows over to the system"""
+        self._file.flush()
+
+    def sync(self):
+        """Make sure the written rows are on disk"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class NpzWriter():
+    """Rows stored as typed columns in chunks of 'chunk_rows' rows"""
+
+    def __init__(self, filename, header, append=False, chunk_rows=1000):
+        """
+        Params:\n
+            - 'filename': CSV file name, the recording goes in binary_path(filename)
+            - 'header': names and units/flags rows of the CSV header
+            - 'append': add chunks to an existing recording
+            - 'chunk_rows': rows per chunk file
+        """
+        self.directory = binary_path(filename)
+        self.chunk_rows = chunk_rows
+        names, units = header
+        self.nb_columns = names.index('Mode') if 'Mode' in names else len(names)
+        self.columns = names[:self.nb_columns]
+        self._rows = []
+        self._nb_chunks = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        chunks = glob.glob(os.path.join(self.directory, "chunk_*.npz"))
+        if append:
+            self._nb_chunks = len(chunks)
+            return
+        for old in chunks:
+            os.remove(old)
+        metadata = {
+            "columns": self.columns,
+            "units": [str(unit) for unit in units[:self.nb_columns]],
+            "metadata": {name: str(value) for name, value in zip(names[self.nb_columns:], units[self.nb_columns:])},
+            "header": [[str(cell) for cell in line] for line in header],
+        }
+        with open(os.path.join(self.directory, "metadata.json"), "w") as file:
+            json.dump(metadata, file, indent=1)
+
+    def write_rows(self, rows):
+        self._rows.extend(rows)
+        while len(self._rows) >= self.chunk_rows:
+            self._save(self._rows[:self.chunk_rows])
+            del self._rows[:self.chunk_rows]
+
+    def flush(self):
+        """
+        Nothing to do: chunks are saved when full, or at sync() (field end) to keep them few.
+        The latency bound of AcquisitionSession does not hold for this format: its rows
+        waiting for a chunk are only on disk in the journal.
+        """
+
+    def sync(self):
+        """Save the rows waiting for a full chunk in a smaller chunk"""
+        if self._rows:
+            self._save(self._rows)
+            self._rows = []
+
+    def close(self):
+        self.sync()
+
+    def _save(self, rows):
+        arrays = {
+            self.columns[0]: np.array([row[0] for row in rows], dtype=np.int64),
+            self.columns[1]: np.array([row[1] for row in rows], dtype=np.float64),
+            self.columns[2]: np.array([row[2] for row in rows], dtype=np.int32),
+        }
+        values = np.array([row[3:self.nb_columns] for row in rows], dtype=np.float64).reshape(len(rows), -1)
+        for i, name in enumerate(self.columns[3:]):
+            arrays[name] = values[:, i]
+        path = os.path.join(self.directory, f"chunk_{self._nb_chunks:06d}.npz")
+        # Written under a temporary name so a chunk is either complete or absent
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        self._nb_chunks += 1
+
+
+def load_npz(directory):
+    """Read a binary recording: (metadata dict, dict of concatenated columns)"""
+    with open(os.path.join(directory, "metadata.json")) as file:
+        metadata = json.load(file)
+    chunks = sorted(glob.glob(os.path.join(directory, "chunk_*.npz")))
+    columns = {name: [] for name in metadata["columns"]}
+    for chunk in chunks:
+        with np.load(chunk) as data:
+            for name in columns:
+                columns[name].append(data[name])
+    dtypes = [np.int64, np.float64, np.int32]
+    for i, name in enumerate(columns):
+        dtype = dtypes[i] if i < len(dtypes) else np.float64
+        columns[name] = np.concatenate(columns[name]) if columns[name] else np.empty(0, dtype=dtype)
+    return metadata, columns
+
+
+def npz_to_csv(directory, csv_filename):
+    """Write a binary recording in the CSV layout of main_program"""
+    metadata, columns = load_npz(directory)
+    with open(csv_filename, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerows(metadata["header"])
+        arrays = list(columns.values())
+        for i in range(len(arrays[0])):
+            row = [int(arrays[0][i]), float(arrays[1][i]), int(arrays[2][i])]
+            row.extend(float(array[i]) for array in arrays[3:])
+            writer.writerow(format_row(row))
+
+
+WRITERS = {
+    "csv": CsvWriter,
+    "npz": NpzWriter,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a binary recording to the CSV layout")
+    parser.add_argument("directory", help="binary recording (.npzd directory)")
+    parser.add_argument("csv_filename", help="CSV file to write")
+    args = parser.parse_args()
+    npz_to_csv(args.directory, args.csv_filename)
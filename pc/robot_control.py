@@ -3,328 +3,312 @@
 Made by Arthur Saint Upery and Ewan Maurel
 """
 
-import socket
-from datetime import datetime
-import time
-import csv
-import serial
-import usb.core
-import usb.util
-import threading
 import queue
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from robot_link import RobotLink
+from sensors import to_float
+from session import AcquisitionSession
+from positions import PositionTable
+
+
+class MeasurementStopped(Exception):
+    """The measurement was stopped by the user in the middle of a field"""
+
 
 class TCPClient():
     """Class for managing the TCP connection with the robot and sensors connection"""
 
-    def __init__(self, ip, port, wind, com, vendor, product, temp, hum, co2, pres, intern_co2):
+    def __init__(self, ip, port, sensors=(), options=None):
         """
         Executed at the begining of each program
         Initialize robot connection
+
+        Params:\n
+            - 'sensors': sensor_plugins.SensorPlugin of each sensor, in the order of the CSV columns
+            - 'options': channels recorded, {GUI checkbox: bool}, see sensor_plugins.options()
         """
         # Sensor and connection settings
         self.csv_file = ""
+        self.positions = None  # PositionTable of csv_file, read at the first use
         self.filename = ""
         self.freq = 1  # Frequency of data acquisition (Hz)
 
         self.ip = ip
         self.port = port
-        self._socket = None
-        self.ser = None  # Serial port for wind sensor
-        self.dev = None  # USB device for CO2 sensor
-        self.wind = wind
-        self.temp = temp
-        self.com = com
-        self.vendor = vendor
-        self.product = product
-        self.hum = hum
-        self.co2 = co2
-        self.pres = pres
-        self.intern_co2 = intern_co2
+        self.link = None  # Asyncio transport of the robot messages
+        self.recv_time = None  # time.monotonic() at which the last recorded position arrived
+        self.move_timeout = None  # Longest motion before 'stop' is sent (s), None to wait for ever
+        self.stream_rate = 100  # Position sampling rate of the robot in Continuous mode (Hz)
+        self.stream_batch = 10  # Positions per message, 1 for the unbatched 'stream_pos'
+        self.sensors = {sensor.name: sensor for sensor in sensors}
+        self.options = dict(options or {})
 
         self.nb_actual_field = 1
+        self.interrupted = threading.Event()  # Set by interrupt(), cleared by the controller
+        self.vertical_speeds = []  # Effective vertical speed of each Continuous pass (mm/s)
+        self.session = None  # Sensor readers and writer, see start_session()
+
+        self.max_staleness = 0.5  # Sensor values further than this from the position time are invalid (s)
+        self.interpolate = True  # Interpolate sensor values at the position time, else take the nearest sample
 
         # Connect to robot via TCP
-        try:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._socket.connect((self.ip, self.port))
-        except Exception as e:
-            raise e
+        self.link = RobotLink(self.ip, self.port).start()
 
-        self._socket.settimeout(5)
+    def connect_sensors(self):
+        """Connect the sensors, raise an exception if one of them is not found"""
+        for sensor in self.sensors.values():
+            sensor.open()
 
-    def connect_wind(self):
-        """Initialize connection with the wind sensor via serial"""
-        try:
-            self.ser = serial.Serial(self.com, 115200, timeout=1)
-            self.ser.write(b'\x03hide S\rhide D\rhide Pitch\rhide Roll\routputrate 20\rexit\r')
-            if self.ser is None:
-                raise ValueError('Device not found.')
-        except ValueError as e:
-            raise e  
-
-    def connect_co2(self):
-        """Initialize connection with the CO2 sensor via USB"""
-        try:
-            self.dev = usb.core.find(idVendor=0x1509, idProduct=0x0A02)
-            self.dev.set_configuration()
-            command = '(USB(Rate 20Hz)(Sources ("CO2B um/m" "H2OB mm/m" "P kPa" "T C")))\n'
-            self.dev.write(0x02, command.encode('utf-8'), timeout=1000)
-        except ValueError as e:
-            raise e              
+    def start_session(self):
+        """Start the acquisition session: sensors stream from now until the socket is closed"""
+        self.session = AcquisitionSession(self)
+        self.session.start()
+        self.link.start_sync()  # Robot clock estimated from now on, to date the positions
 
     def close_socket(self):
         """Close robot and sensor connections properly"""
-        if self.ser:
-            self.ser.close()
-        if self.dev:
-            usb.util.release_interface(self.dev, 0)
-        self.send("end")
-
-    def recv(self, bufsize=255):
-        """Read data from robot TCP socket"""
-        response = None
-        while response is None:
-            try:
-                response = self._socket.recv(bufsize).decode()
-            except socket.timeout:
-                response = "timeout"
-            except Exception as e:
-                raise e
-            if response:
-                if "\r" in response:
-                    parts = response.split("\r")
-                    # Return the line that includes 'done' if found
-                    return next((r for r in parts if "done" in r), parts[0])
-                response = None
+        if self.session:
+            self.session.close()
+            self.session = None
+        for sensor in self.sensors.values():
+            sensor.close()
+        try:
+            self.send("end")
+        finally:
+            self.link.shutdown()
+
+    def recv(self, timeout=5):
+        """
+        Return the next message sent by the robot that is neither an acknowledgement
+        nor a position (those go to the waiting commands, see robot_link)
+        """
+        return self.link.run(self.link.receive(timeout))
 
     def send(self, cmd):
         """Send a command to the robot via TCP"""
-        cmd += "\r"
-        bytes_sent = self._socket.send(cmd.encode())
-        return 0 if len(cmd) == bytes_sent else -1
+        self.link.run(self.link.send(cmd))
+        return 0
 
     def stop(self):
         """Send stop command to robot"""
         self.send("stop")
 
-    def get_data(self, stop_event):
-        read_values = b""
-        while not stop_event.is_set():
+    def interrupt(self):
+        """
+        Stop the motion in progress, from another thread: its command is cancelled (the robot
+        is sent 'stop') and the motions and dwells raise MeasurementStopped until `interrupted` is cleared
+        """
+        self.interrupted.set()
+        self.link.cancel_commands()
+
+    def start_stream(self):
+        """Make the robot stream its position, in batches of `stream_batch` samples"""
+        if self.stream_batch > 1:
+            self.send(f"stream_batch,{1 / self.stream_rate},{self.stream_batch}")
+        else:
+            self.send("stream_pos")
 
-            """Read continuously wind sensor data from serial and update `data` list in a background threadGet"""
-            try:
-                read = self.ser.readline()
-                if read:
-                    read = read.decode(errors="ignore").strip()
-                    values = read.split()
-                    self.wind_data = [values[1], # e.g., wind direction U
-                            values[3], # e.g., wind direction V
-                            values[5], # e.g., wind direction W
-                            values[13], # Magnetic
-                            values[7], # Temperature
-                            values[11]] # Pressure
-            except Exception:
-                self.wind_data = ["Error"] * 6
-
-            """Read continuously from CO2 USB sensor in a background thread"""
-            try:
-                if self.dev is None:
-                    raise ValueError("error")
-                reading = self.dev.read(0x86, 64, timeout=5000)
-                read_values += bytes(reading)
-                if b'\n' in read_values:
-                    line, read_values = read_values.split(b'\n', 1)
-                    line_list = line.decode('utf-8').split('\t')
-                    try:
-                        self.co2_data = [
-                            line_list[2],   # CO2
-                            line_list[3],  # H2O
-                            line_list[4],  # Pressure
-                            line_list[5],  # Temperature
-                        ]
-                    except:
-                        self.co2_data = ["Error"] * 4
-            except (usb.core.USBError, ValueError):
-                self.dev = usb.core.find(idVendor=0x1509, idProduct=0x0A02)
-                if self.dev:
-                    self.dev.set_configuration()
-                self.co2_data = ["Error"] * 4
-    
-    def acquisition(self, start):
-        """Handle sensor data acquisition based on time interval"""
-        response = self.recv()
-        timea = time.time()
-        elapsed = timea - start
-        if ("posx" in response) and elapsed >= (1/self.freq):
-            now = datetime.now()
-            timestamp = now.strftime('%Y-%m-%d %H:%M:%S') + f".{int(now.microsecond/10000):02d}" #convert microsecond to centisecond
-            start = timea
-            pos = response.split(",")
-            position_z = pos[3]
-
-            row = [timestamp, position_z, self.nb_actual_field]
-            
-            if self.wind:
-                row.extend(self.wind_data[0:4])
-            if self.temp:
-                row.append(self.wind_data[4])
-            if self.pres:
-                row.append(self.wind_data[5])
-            if self.co2:
-                row.append(self.co2_data[0])
-            if self.hum:
-                row.append(self.co2_data[1])
-            if self.intern_co2:
-                row.extend(self.co2_data[2:4])
-            self.data_queue.put(row)
-
-        return response, start
-    
-    def csv_writer_thread(self):
-        buffer = []
-        while not self.stop_writing.is_set() or not self.data_queue.empty():
-            try:
-                item = self.data_queue.get(timeout=0.1)
-                buffer.append(item)
-            except queue.Empty:
-                pass
+    def stop_stream(self):
+        self.send("stop_stream")
 
-            if len(buffer) >= 100:
-                self.flush_to_csv(buffer)
-                buffer.clear()
+    def get_data(self, stop_event):
+        """
+        Stream the sensors until 'stop_event' is set, each one in its own thread
+        so a slow or absent sensor does not hold back the others
+        """
+        for sensor in self.sensors.values():
+            sensor.start_stream()
+        stop_event.wait()
+        for sensor in self.sensors.values():
+            sensor.stop_stream()
 
-        # final flush if necessary
-        if buffer:
-            self.flush_to_csv(buffer)
+    def columns(self):
+        """Channels recorded, in the order of the CSV columns"""
+        return [sensor.channels[i] for sensor in self.sensors.values() for i in sensor.description.selected(self.options)]
 
-    def flush_to_csv(self, rows):
+    def acquisition(self, sample, start):
+        """
+        Record a row for the position 'sample' (reception time, 'posx,...' message)
+        if 1/freq elapsed since 'start' (time.monotonic() of the last recorded sample); return the new start
+        """
+        recv_time, response = sample
+        if recv_time - start < 1/self.freq:
+            return start
+        self.recv_time = recv_time
+        pos = response.split(",")
+        position_z = to_float(pos[3])
+
+        # Time at which the position was sampled, not the time it is processed (batches arrive late)
+        sample_time = time.time_ns() - int((time.monotonic() - self.recv_time) * 1e9)
+        row = [sample_time, position_z, self.nb_actual_field]
+        # Sensor values at the time the position arrived, NaN when too stale, in the order of columns()
+        for sensor in self.sensors.values():
+            selected = sensor.description.selected(self.options)
+            if selected:
+                values = self.sensor_values(sensor)
+                row.extend(values[i] for i in selected)
+        self.session.put(row)
+        return recv_time
+
+    def sensor_values(self, sensor):
+        """Values of a sensor at the time of the last robot message"""
+        return sensor.at(self.recv_time, self.max_staleness, self.interpolate).tolist()
+    
+    def move(self, command, pos, acquire=False):
+        """
+        Send a motion command and wait for its completion.
+        With 'acquire', the positions streamed meanwhile are recorded with the sensor values.
+        Raise TimeoutError (after sending 'stop') if it lasts more than `move_timeout`,
+        MeasurementStopped if it is interrupted (see interrupt()).
+        """
+        if self.interrupted.is_set():
+            raise MeasurementStopped()
+        if not acquire:
+            try:
+                self.link.run(self.link.command(command, pos, self.move_timeout))
+            except CancelledError:
+                raise MeasurementStopped()
+            return
+        samples = queue.Queue()
+        def receive(recv_time, message):
+            samples.put((recv_time, message))
+        self.link.subscribe(receive)
+        done = self.link.submit(self.link.command(command, pos, self.move_timeout))
+        done.add_done_callback(lambda _: samples.put(None))  # After the positions sent before the end
+        try:
+            start = time.monotonic()
+            sample = samples.get()
+            while sample is not None:
+                start = self.acquisition(sample, start)
+                sample = samples.get()
+        finally:
+            self.link.unsubscribe(receive)
         try:
-            with open(self.filename, mode='a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerows(rows)
-        except IOError:
-            pass            
+            done.result()
+        except CancelledError:
+            raise MeasurementStopped()
 
     def goto(self, pos):
         """Go to Cartesian position and wait for completion"""
-        msg = "goto," + ",".join(map(str, pos))
-        self.send(msg)
-        response = None
-        while response != "goto,done":
-            response = self.recv()
+        self.move("goto", pos)
 
     def sgoto(self, pos):
         """Go slowly to Cartesian position and wait for completion
         'sgoto' = 'slow goto' (slower for measure)"""
-        msg = "sgoto," + ",".join(map(str, pos))
-        self.send(msg)
-        response = None
-        start = time.time()
-        while response != "sgoto,done":
-            response, start = self.acquisition(start)
-            
+        self.move("sgoto", pos, acquire=True)
+
     def gotoj(self, pos):
         """Go to joint position and wait for completion"""
-        msg = "gotoj," + ",".join(map(str, pos))
-        self.send(msg)
-        response = None
-        while response != "gotoj,done":
-            response = self.recv()
+        self.move("gotoj", pos)
 
     def sgotoj(self, pos):
         """
         Go to joint position slowly and wait for completion.
         'sgotoj' = 'slow gotoj' (slower for measure)
         """
-        msg = "sgotoj," + ",".join(map(str, pos))
-        self.send(msg)
-        response = None
-        start = time.time()
-        while response != "sgotoj,done":
-            response, start = self.acquisition(start)
+        self.move("sgotoj", pos, acquire=True)
 
     def get_current_posx(self):
         """Ask current Cartesian position of the tool"""
-        self.send("get_current_posx")
-        response = ""
-        while "posx" not in response:
-            response = self.recv()
+        return self.parse_posx(self.link.run(self.link.position(5))[1])
+
+    @staticmethod
+    def parse_posx(response):
+        """Cartesian position of a 'posx,x,y,z,a,b,c,sol_space,t' message"""
         response = response.split(",")
-        posx = list(map(float, response[1:-1]))
-        sol_space = response[-1]
+        posx = list(map(float, response[1:7]))
         return posx
 
-    def find_start_pos(self, distance):
-        """Find the starting joint position that corresponds to a TY close to 'distance'"""
-        with open(self.csv_file, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            column_names = next(reader)
-            try:
-                index_tx = column_names.index('TY')
-            except ValueError:
-                exit()
-
-            start_field = []
-            for line in reader:
-                try:
-                    tx_val = float(line[index_tx])
-                    if abs(tx_val - distance) <= 50:
-                        start_field = list(map(float, line[:6]))
-                except (ValueError, IndexError):
-                    continue
-            return start_field if start_field else exit()
-
-
-    def up_down_field(self, mode, start_field, ground_level, nb_measures, callback=None):
+    def find_start_pos(self, distance, interpolate=False):
         """
-        Perform up/down movement in the field and acquire sensor data.
-        'mode' can be "Continuous" or "Discontinuous"
+        Find the starting joint position that corresponds to a TY close to 'distance':
+        the closest row of `csv_file` (or the pose interpolated between rows).
+        Raise positions.PositionNotFound if there is none.
         """
-        # Start background thread for continuous CO2 reading
-        stop_data_thread = threading.Event()
-        data_thread = threading.Thread(target=self.get_data, args=(stop_data_thread,))
-        data_thread.start()
-        self.wind_data = ["Error"] * 6
-        self.co2_data = ["Error"] * 4
-
-        # Start background thread for writing in csv file
-        self.data_queue = queue.Queue()
-        self.stop_writing = threading.Event()
-        self.writer_thread = threading.Thread(target=self.csv_writer_thread, daemon=True)
-        self.writer_thread.start()
-
-        interval = ground_level / nb_measures
-        start_pos = [start_field[0], 0, 10, 0, 80, 180]
-        self.gotoj(start_pos)
-
-        if mode == "Continuous":
-            self.send("stream_pos")
+        if self.positions is None or self.positions.csv_file != self.csv_file:
+            self.positions = PositionTable(self.csv_file)  # Read once, then indexed in memory
+        if interpolate:
+            return self.positions.interpolate(distance)
+        return self.positions.nearest(distance)
+
+    def speed_report(self):
+        """Effective vertical speed of the Continuous passes, for the end of a recording"""
+        if not self.vertical_speeds:
+            return ""
+        speeds = sorted(self.vertical_speeds)
+        return (f"Vertical speed: {sum(speeds) / len(speeds):.1f} mm/s mean, {speeds[0]:.1f} - {speeds[-1]:.1f} mm/s "
+                f"over {len(speeds)} passes")
+
+    def dwell_acquisition(self, dwell, level=None):
+        """
+        Record the position and sensors at the current level: once, or at `freq` during 'dwell' (s).
+        With 'level' (depth, position), every sensor sample meanwhile goes to the statistics of the level.
+        Raise MeasurementStopped if it is interrupted (see interrupt()), the samples of the level so far being kept.
+        """
+        levels = self.session.levels if level else None
+        if levels:
+            levels.begin(self.nb_actual_field, *level)
+        end = time.monotonic() + dwell
+        start = 0
+        try:
+            while True:
+                start = self.acquisition(self.link.run(self.link.position(5)), start)
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.interrupted.wait(min(1 / self.freq, remaining)):
+                    raise MeasurementStopped()
+                if levels:
+                    levels.fold()
+        finally:
+            if levels:
+                levels.end()
+
+    def up_down_field(self, mode, start_field, plan, callback=None):
+        """
+        Go to the top of the field with a fast joint move, then perform the passes
+        of 'plan' (trajectory.FieldPlan) and acquire sensor data; the arm ends at the top.
+        'mode' can be "Continuous" or "Discontinuous".
+        Raise MeasurementStopped if it is interrupted (see interrupt()): the field is not marked as ended.
+        """
+        self.session.mark("field_start", self.nb_actual_field)
 
-        time.sleep(1)
-
-        self.sgotoj(start_field)
-        pos_field = self.get_current_posx()
-        sign = 1
-        for _ in range(2):  # up and down
-            sign *= -1
-            for _ in range(nb_measures):
-                pos_field[2] += interval * sign
-                self.sgoto(pos_field)
-                if mode == "Discontinuous":
-                    self.acquisition(0)
-        self.sgotoj(start_pos)
-        if callback:
-            callback()
-
-        if mode == "Continuous":
-            self.send("stop_stream")
-
-        # Stop CO2 reading thread
-        stop_data_thread.set()
-        data_thread.join()
-        if self.dev:
-            usb.util.release_interface(self.dev, 0)
-
-        # Stop csv file writing thread
-        self.stop_writing.set()
-        self.writer_thread.join()
+        # Transit: nothing is recorded, so no need to move slowly
+        self.gotoj(start_field)
+
+        # Positions streamed in Continuous mode, and in both modes for the raw capture
+        streaming = mode == "Continuous" or self.session.raw is not None
+        if streaming:
+            self.start_stream()
+
+        try:
+            pos_field = self.get_current_posx()
+            top = pos_field[2]
+            for depths in plan.passes(mode):  # Alternately down and up, in one motion in Continuous mode
+                self.session.mark("pass_start", self.nb_actual_field)
+                pass_start = time.monotonic()
+                pass_top = pos_field[2]
+                for depth in depths:
+                    pos_field[2] = top - depth
+                    if mode == "Continuous":
+                        self.sgoto(pos_field)
+                    else:
+                        # Rows are recorded at the levels only, even when the positions are streamed
+                        self.move("sgoto", pos_field)
+                        self.dwell_acquisition(plan.dwell, (depth, pos_field[2]))
+                if mode == "Continuous":
+                    self.vertical_speeds.append(abs(pos_field[2] - pass_top) / (time.monotonic() - pass_start))
+            if not plan.ends_at_top:
+                # Back to the top without measuring
+                pos_field[2] = top
+                self.goto(pos_field)
+            if callback:
+                callback()
+        finally:
+            if streaming:
+                self.stop_stream()
+
+        self.session.mark("field_end", self.nb_actual_field)
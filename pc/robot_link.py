@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Asyncio transport of the robot protocol (robot/robot_main.txt).
+One reader task frames every incoming message and routes it:
+    - '<command>,done' resolves the oldest command of that name waiting for it,
+    - 'posx,...' answers the position requests and goes to the stream subscribers,
+    - 'posb,t,x,...;t,x,...' (batched stream) is split into 'posx,...' samples for the subscribers,
+    - 'sync,t1,t2,t3' answers a clock exchange (see clock_sync),
+    - anything else ('Hi'...) is kept for receive().
+Several commands can be in flight; a command that times out or is cancelled
+(cancel_commands(), e.g. when the user stops the measurement) sends 'stop' to
+the robot, and its late acknowledgement is dropped.
+
+The event loop runs in its own thread so the threads of the program
+(controller, acquisition) can use it through run() and submit().
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import defaultdict, deque
+
+from clock_sync import ClockSync
+from line_buffer import LineBuffer
+from sensors import to_float
+
+
+class RobotLink():
+    """Connection to the robot, driven by an asyncio event loop"""
+
+    def __init__(self, host, port, connect_timeout=5):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.loop = None
+        self._thread = None
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._rx = LineBuffer(b"\r")
+        self._pending = defaultdict(deque)  # Command name -> futures waiting for '<name>,done'
+        self._orphans = defaultdict(int)  # Command name -> acknowledgements of cancelled commands to drop
+        self._commands = set()  # Tasks of the commands waiting for their acknowledgement
+        self._positions = deque()  # Futures waiting for the next posx message
+        self._subscribers = []  # Called with (reception time, message) for every posx message
+        self._inbox = None  # Other messages, for receive()
+        self._error = None  # Why the connection ended
+        self._syncs = {}  # 't1' sent -> future waiting for the answer of the robot
+        self._sync_task = None
+        self.clock = ClockSync()  # Robot controller clock -> time.monotonic()
+        self.nb_messages = 0
+        self.subscriber_error = None  # Last exception raised by a subscriber, the others are still called
+
+    # ==== Event loop thread ====
+    def start(self):
+        """Start the event loop thread and connect; raise OSError if the robot can't be reached"""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        try:
+            self.run(self.open())
+        except Exception:
+            self._stop_loop()
+            raise
+        return self
+
+    def submit(self, coroutine):
+        """Schedule 'coroutine' on the event loop, from another thread: concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine, timeout=None):
+        """Run 'coroutine' on the event loop and wait for its result, from another thread"""
+        return self.submit(coroutine).result(timeout)
+
+    def shutdown(self):
+        """Close the connection and stop the event loop thread"""
+        if self.loop is None:
+            return
+        if self.loop.is_running():
+            self.run(self.close())
+        self._stop_loop()
+
+    def _stop_loop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.loop = None
+
+    @property
+    def connected(self):
+        """False once the connection is closed or lost"""
+        return self._writer is not None and self._error is None
+
+    # ==== Coroutines ====
+    async def open(self):
+        self._inbox = asyncio.Queue()
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.connect_timeout)
+        self._read_task = asyncio.ensure_future(self._read())
+
+    async def close(self):
+        if self._sync_task:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        if self._read_task:
+            self._read_task.cancel()
+            await asyncio.gather(self._read_task, return_exceptions=True)
+            self._read_task = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        self._fail(ConnectionError("Connection closed"))
+
+    async def send(self, msg):
+        if self._writer is None:
+            raise ConnectionError("Not connected to the robot")
+        self._writer.write((msg + "\r").encode())
+        await self._writer.drain()
+
+    async def command(self, name, values=(), timeout=None):
+        """
+        Send '<name>,<values>' and wait for '<name>,done'; return its reception time.
+        On timeout or cancellation the robot is sent 'stop' and the error is raised.
+        """
+        future = self._wait(self._pending[name])
+        task = asyncio.current_task()
+        self._commands.add(task)
+        try:
+            await self.send(",".join([name] + [str(value) for value in values]))
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if not future.done():
+                self._pending[name].remove(future)
+                self._orphans[name] += 1
+                future.cancel()
+                await self.send("stop")
+            raise
+        finally:
+            self._commands.discard(task)
+
+    async def position(self, timeout=None):
+        """Ask the current position: (reception time, 'posx,...' message)"""
+        future = self._wait(self._positions)
+        await self.send("get_current_posx")
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            if not future.done():
+                self._positions.remove(future)
+                future.cancel()
+
+    async def receive(self, timeout=None):
+        """Next message that is neither an acknowledgement nor a position"""
+        if self._error and self._inbox.empty():
+            raise self._error
+        message = await asyncio.wait_for(self._inbox.get(), timeout)
+        if message is None:
+            raise self._error
+        return message
+
+    async def sync(self, timeout=5):
+        """One clock exchange with the robot, added to `clock`"""
+        t1 = f"{time.monotonic():.6f}"
+        future = self._wait_sync(t1)
+        try:
+            await self.send("sync," + t1)
+            t2, t3, t4 = await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            self._syncs.pop(t1, None)
+        self.clock.add(float(t1), t2, t3, t4)
+
+    async def keep_synchronised(self, period=1.0):
+        """Clock exchanges every 'period' seconds until the connection is closed"""
+        while self._error is None:
+            try:
+                await self.sync()
+            except asyncio.TimeoutError:
+                pass  # Robot busy with a long motion, or a program without 'sync'
+            except ConnectionError:
+                return
+            await asyncio.sleep(period)
+
+    def start_sync(self, period=1.0):
+        """Start the clock exchanges, from another thread, once the robot has been greeted"""
+        def start():
+            if self._sync_task is None:
+                self._sync_task = asyncio.ensure_future(self.keep_synchronised(period))
+        self.loop.call_soon_threadsafe(start)
+
+    def sample_time(self, now, robot_time):
+        """PC time of a sample stamped 'robot_time' by the controller, 'now' if the clock is not known yet"""
+        if robot_time is None or math.isnan(robot_time) or not self.clock.ready:
+            return now
+        return self.clock.to_local(robot_time)
+
+    def cancel_commands(self):
+        """
+        Cancel the commands waiting for their acknowledgement, from another thread:
+        the robot is sent 'stop' and their callers get concurrent.futures.CancelledError
+        """
+        def cancel():
+            for task in list(self._commands):
+                task.cancel()
+        self.loop.call_soon_threadsafe(cancel)
+
+    def subscribe(self, callback):
+        """Call 'callback(reception time, message)' in the event loop thread for every posx message"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    # ==== Reader task ====
+    def _wait(self, waiters):
+        if self._error:
+            raise self._error
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        return future
+
+    def _wait_sync(self, t1):
+        if self._error:
+            raise self._error
+        future = asyncio.get_running_loop().create_future()
+        self._syncs[t1] = future
+        return future
+
+    async def _read(self):
+        try:
+            while True:
+                data = await self._reader.read(4096)
+                if not data:
+                    break
+                now = time.monotonic()
+                for msg in self._rx.feed(data):
+                    self._dispatch(now, msg)
+            self._fail(ConnectionError("Connection closed by the robot"))
+        except OSError as e:
+            self._fail(ConnectionError(f"Connection lost: {e}"))
+        except Exception as e:
+            # Never leave the commands waiting on a reader that is gone
+            self._fail(ConnectionError(f"Robot link reader stopped: {e!r}"))
+
+    def _dispatch(self, now, msg):
+        self.nb_messages += 1
+        name, _, rest = msg.partition(",")
+        if rest == "done":
+            if self._orphans[name]:
+                self._orphans[name] -= 1
+            elif self._pending[name]:
+                self._pending[name].popleft().set_result(now)
+            return
+        if name == "posx":
+            # 'posx,x,y,z,a,b,c,sol_space,t': sampled at the controller time t
+            values = rest.split(",")
+            robot_time = to_float(values[7]) if len(values) > 7 else None
+            sample_time = self.sample_time(now, robot_time)
+            if self._positions:
+                self._positions.popleft().set_result((sample_time, msg))
+            self._notify(sample_time, msg)
+            return
+        if name == "sync":
+            # Answer to an exchange still waited for, late answers are dropped
+            values = rest.split(",")
+            if len(values) != 3:
+                return
+            future = self._syncs.pop(values[0], None)
+            t2, t3 = to_float(values[1]), to_float(values[2])
+            if future is not None and not future.done() and not math.isnan(t2 + t3):
+                future.set_result((t2, t3, now))
+            return
+        if name == "posb":
+            self._dispatch_batch(now, rest)
+            return
+        self._inbox.put_nowait(msg)
+
+    def _dispatch_batch(self, now, batch):
+        """
+        Give the samples of a batch to the subscribers as 'posx,x,y,z,a,b,c,sol_space,t'.
+        Until the robot clock is known, the last sample of the batch is taken as
+        sampled at reception and the others earlier by their controller time difference.
+        """
+        samples = []
+        for sample in batch.split(";"):
+            stamp, _, values = sample.partition(",")
+            robot_time = to_float(stamp)
+            if values and not math.isnan(robot_time):
+                samples.append((robot_time, stamp, values))  # Cut or corrupted samples are skipped
+        if not samples:
+            return
+        last = samples[-1][0]
+        for robot_time, stamp, values in samples:
+            message = "posx," + values + "," + stamp
+            if self.clock.ready:
+                sample_time = self.clock.to_local(robot_time)
+            else:
+                sample_time = now - (last - robot_time)
+            self._notify(sample_time, message)
+
+    def _notify(self, sample_time, message):
+        """Give a position to the subscribers; one that raises does not stop the reader"""
+        for callback in list(self._subscribers):
+            try:
+                callback(sample_time, message)
+            except Exception as e:
+                self.subscriber_error = e
+
+    def _fail(self, error):
+        """Wake everything waiting on the connection with 'error'"""
+        if self._error is None:
+            self._error = error
+        waiting = [future for waiters in self._pending.values() for future in waiters]
+        waiting.extend(self._positions)
+        waiting.extend(self._syncs.values())
+        for future in waiting:
+            if not future.done():
+                future.set_exception(self._error)
+        self._pending.clear()
+        self._positions.clear()
+        self._syncs.clear()
+        if self._inbox is not None:
+            self._inbox.put_nowait(None)
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Local stand-in for the robot running robot/robot_main.txt + robot/robot.txt.
+It speaks the same TCP protocol so TCPClient and main_program can run without the arm:
+    python robot_simulator.py --port 20002 --time-scale 0.1 --latency 0.005 --jitter 0.002
+"""
+
+import argparse
+import math
+import os
+import queue
+import random
+import socket
+import threading
+import time
+
+from line_buffer import LineBuffer
+from positions import PositionTable
+from trajectory import MOTIONS, motion_time
+
+class RobotSimulator():
+    """TCP server answering the commands of robot_main.txt with a simple motion model"""
+
+    def __init__(self, host="127.0.0.1", port=20002, time_scale=1.0, stream_rate=100,
+                 latency=0.0, jitter=0.0, poll_period=0.1, field_height=0.0, table=None, seed=None,
+                 clock_offset=0.0, clock_drift=0.0):
+        """
+        Params:\n
+            - 'time_scale': factor applied to every motion duration (0.1 = ten times faster than the arm)
+            - 'stream_rate': rate of the posx messages sent after 'stream_pos' (Hz), 'stream_batch' gives its own
+            - 'latency', 'jitter': delay added to every message sent, fixed part and random part (s)
+            - 'poll_period': period of the check_motion() loop of robot.txt (s)
+            - 'field_height': Z of the tool after a joint move (mm)
+            - 'table': PositionTable used to place the tool after a joint move
+            - 'clock_offset', 'clock_drift': controller clock against time.monotonic() (s, ppm)
+        """
+        self.host = host
+        self.port = port
+        self.time_scale = time_scale
+        self.stream_rate = stream_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.poll_period = poll_period
+        self.field_height = field_height
+        self.table = table
+        self._random = random.Random(seed)
+        self.clock_offset = clock_offset
+        self.clock_drift = clock_drift
+        self.sol_space = 2  # Solution space reported with every position
+
+        self._posj = [0.0, 0.0, 140.0, 0.0, -50.0, 180.0]
+        self._posx = self.forward(self._posj)
+        self._motion = None  # (start posx, target posx, start time, duration)
+        self._lock = threading.Lock()
+
+        self._server = None
+        self._conn = None
+        self._rx = LineBuffer(b"\r")
+        self._pending = []  # Messages read during a motion, handled once it is over
+        self._out = queue.Queue()
+        self._streaming = threading.Event()
+        self._batch = []  # Samples of the batched stream not sent yet
+        self._batch_lock = threading.Lock()
+        self._running = threading.Event()
+        self._thread = None
+
+        self.on_command = None  # Called with every command received, e.g. to time them
+
+        # Statistics of the current session
+        self.nb_commands = 0
+        self.nb_stream_samples = 0
+
+    # ==== Motion model ====
+    def forward(self, posj):
+        """Tool Cartesian position for a joint pose, using the closest row of the table"""
+        radius = 0.0
+        if self.table is not None:
+            distances = ((self.table.poses[:, 1:] - posj[1:]) ** 2).sum(axis=1)
+            radius = float(self.table.ty[distances.argmin()])
+        angle = math.radians(posj[0])
+        return [radius * math.cos(angle), radius * math.sin(angle), self.field_height, 90.0, 180.0, 0.0]
+
+    def _interpolate(self):
+        start, target, t0, duration = self._motion
+        fraction = 1.0 if duration <= 0 else min((time.monotonic() - t0) / duration, 1.0)
+        return [a + (b - a) * fraction for a, b in zip(start, target)]
+
+    def current_posx(self):
+        """Tool position, interpolated along the ongoing motion"""
+        with self._lock:
+            if self._motion is None:
+                return list(self._posx)
+            return self._interpolate()
+
+    def move(self, command, values):
+        """Run a motion command and block until it is over, like robot.txt"""
+        kind, vel, acc = MOTIONS[command]
+        target = [float(elem) for elem in values]
+        start = self.current_posx()
+        if kind == "movel":
+            target_x = target
+            distance = math.dist(start[:3], target[:3])
+        else:
+            target_x = self.forward(target)
+            distance = max(abs(a - b) for a, b in zip(self._posj, target))
+            self._posj = target
+        duration = motion_time(distance, vel, acc) * self.time_scale
+        with self._lock:
+            self._motion = (start, target_x, time.monotonic(), duration)
+        # The robot only notices the end of the motion at its next check_motion() poll
+        poll = self.poll_period * self.time_scale
+        self.wait_motion(time.monotonic() + (math.ceil(duration / poll) * poll if poll > 0 else duration), poll)
+        with self._lock:
+            if self._motion is not None:
+                self._posx = target_x
+                self._motion = None
+        self.flush_batch()
+        self.write(command + ",done")
+
+    def wait_motion(self, end, poll):
+        """
+        Wait until 'end', reading the messages meanwhile like TCPServer.wait_motion in robot.txt:
+        'stop' stops the motion at once, clock exchanges are answered, the others are kept for later
+        """
+        while self._conn is not None:
+            delay = end - time.monotonic()
+            if delay <= 0:
+                return
+            self._conn.settimeout(min(delay, poll) if poll > 0 else delay)
+            try:
+                data = self._conn.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            finally:
+                self._conn.settimeout(0.2)
+            if not data:
+                return
+            messages = self._rx.feed(data)
+            for i, msg in enumerate(messages):
+                if msg == "stop":
+                    self.handle(msg)
+                    self._pending.extend(messages[i + 1:])
+                    return
+                if msg.startswith("sync,"):
+                    self.handle(msg)
+                else:
+                    self._pending.append(msg)
+
+    def stop_motion(self):
+        """Stop the ongoing motion where the tool is"""
+        with self._lock:
+            if self._motion is not None:
+                self._posx = self._interpolate()
+                self._motion = None
+
+    def controller_time(self):
+        """time.monotonic() of the robot controller"""
+        now = time.monotonic()
+        return now + self.clock_offset + now * self.clock_drift * 1e-6
+
+    # ==== Communication ====
+    def write(self, msg):
+        """Queue 'msg' for sending after the configured latency, keeping the order"""
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        self._out.put((time.monotonic() + delay, (msg + "\r").encode("ascii")))
+
+    def get_posx(self):
+        """Send the tool position in the format of robot.txt"""
+        posx = self.current_posx()
+        self.write("posx," + str(posx).replace(']', '').replace('[', '') + ',' + str(self.sol_space)
+                   + f",{self.controller_time():.4f}")
+
+    def flush_batch(self):
+        """Send the samples of the batched stream, like PositionStream.flush in robot.txt"""
+        with self._batch_lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            self.write("posb," + ";".join(batch))
+
+    def _sender(self, conn):
+        deliver_at = 0.0
+        while True:
+            item = self._out.get()
+            if item is None:
+                return
+            # TCP keeps the order: a message never overtakes the previous one
+            deliver_at = max(deliver_at, item[0])
+            delay = deliver_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                conn.sendall(item[1])
+            except OSError:
+                return
+
+    def _stream(self):
+        period = 1 / self.stream_rate
+        next_time = time.monotonic()
+        while self._streaming.is_set() and self._running.is_set():
+            self.get_posx()
+            self.nb_stream_samples += 1
+            next_time += period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+
+    def _stream_batch(self, period, batch_size):
+        next_time = time.monotonic()
+        while self._streaming.is_set() and self._running.is_set():
+            posx = self.current_posx()
+            sample = f"{self.controller_time():.4f}," + str(posx).replace(']', '').replace('[', '') + ',' + str(self.sol_space)
+            with self._batch_lock:
+                self._batch.append(sample)
+                full = len(self._batch) >= batch_size
+            if full:
+                self.flush_batch()
+            self.nb_stream_samples += 1
+            next_time += period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+
+    def handle(self, cmd):
+        """Execute one command, return False when the session is over"""
+        self.nb_commands += 1
+        if self.on_command:
+            self.on_command(cmd)
+        msg = cmd.split(",")
+        if msg[0] in MOTIONS:
+            self.move(msg[0], msg[1:])
+        elif msg[0] == "get_current_posx":
+            self.get_posx()
+        elif msg[0] == "stream_pos":
+            if not self._streaming.is_set():
+                self._streaming.set()
+                threading.Thread(target=self._stream, daemon=True).start()
+        elif msg[0] == "stream_batch":
+            if not self._streaming.is_set():
+                self._streaming.set()
+                threading.Thread(target=self._stream_batch, args=(float(msg[1]), int(msg[2])),
+                                 daemon=True).start()
+        elif msg[0] == "stop_stream":
+            self._streaming.clear()
+            self.flush_batch()
+        elif msg[0] == "sync":
+            self.write(f"sync,{msg[1]},{self.controller_time():.6f},{self.controller_time():.6f}")
+        elif msg[0] == "stop":
+            self.stop_motion()
+            self.write("stop,done")
+        elif msg[0] == "end":
+            return False
+        return True
+
+    def _session(self, conn):
+        self._conn = conn
+        self.nb_commands = 0
+        self.nb_stream_samples = 0
+        sender = threading.Thread(target=self._sender, args=(conn,), daemon=True)
+        sender.start()
+        self._rx = LineBuffer(b"\r")
+        self._pending = []
+        greeted = False
+        try:
+            while self._running.is_set():
+                if self._pending:
+                    messages, self._pending = self._pending, []
+                else:
+                    try:
+                        data = conn.recv(4096)
+                    except socket.timeout:
+                        continue
+                    if not data:
+                        break
+                    messages = self._rx.feed(data)
+                for msg in messages:
+                    if not greeted:
+                        # First message is the greeting of the computer
+                        greeted = True
+                        self.write("Hi")
+                        continue
+                    if not self.handle(msg):
+                        return
+        except OSError:
+            pass
+        finally:
+            self._streaming.clear()
+            self._out.put(None)
+            sender.join()
+            conn.close()
+            self._conn = None
+
+    def serve(self, once=False):
+        """Accept computers one after the other, like restarting the robot program"""
+        while self._running.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            conn.settimeout(0.2)
+            self._out = queue.Queue()
+            self._session(conn)
+            if once:
+                return
+
+    def start(self, once=False):
+        """Open the server socket and serve in a background thread"""
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(1)
+        self._server.settimeout(0.2)
+        self.port = self._server.getsockname()[1]
+        self._running.set()
+        self._thread = threading.Thread(target=self.serve, args=(once,), daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._running.clear()
+        self._streaming.clear()
+        if self._thread:
+            self._thread.join()
+        if self._server:
+            self._server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local robot simulator for offline tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=20002)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--stream-rate", type=float, default=100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--clock-offset", type=float, default=0.0)
+    parser.add_argument("--clock-drift", type=float, default=0.0)
+    args = parser.parse_args()
+
+    table = PositionTable(os.path.join(os.path.dirname(os.path.abspath(__file__)), "max_positions.csv"))
+    simulator = RobotSimulator(args.host, args.port, args.time_scale, args.stream_rate,
+                               args.latency, args.jitter, table=table,
+                               clock_offset=args.clock_offset, clock_drift=args.clock_drift).start()
+    print(f"Robot simulator listening on {args.host}:{simulator.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.close()
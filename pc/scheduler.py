@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Order of the fields of a measurement and the transit moves between them.
+The arm goes from the top of one column to the start of the next with a
+single fast joint move (gotoj), nothing is recorded meanwhile; slow moves
+are only used inside the measured columns (see trajectory).
+"""
+
+import itertools
+import time
+
+from trajectory import MOTIONS, motion_time
+
+
+def transit_time(posej_a, posej_b):
+    """Duration of a gotoj between two joint poses: the joint with the longest way leads"""
+    _, vel, acc = MOTIONS["gotoj"]
+    return motion_time(max(abs(a - b) for a, b in zip(posej_a, posej_b)), vel, acc)
+
+
+class FieldScheduler():
+    """Plans the order of the fields of each cycle and times the cycles"""
+
+    def __init__(self, start_fields, plans, posej):
+        """
+        Params:\n
+            - 'start_fields': joint pose at the top of each field's column
+            - 'plans': trajectory.FieldPlan of each field
+            - 'posej': joint pose of the arm before the first field
+        """
+        self.start_fields = start_fields
+        self.plans = plans
+        self.posej = list(posej)
+        self.cycle_times = []
+        self._cycle_start = None
+
+    def order(self, fields=None):
+        """
+        Fields of the next cycle ('fields', by default all of them) in the order
+        with the shortest transit from the current pose: each cycle starts
+        with the field where the previous one ended.
+        """
+        if fields is None:
+            fields = range(len(self.start_fields))
+
+        def total_transit(order):
+            poses = [self.posej] + [self.start_fields[j] for j in order]
+            return sum(transit_time(a, b) for a, b in zip(poses, poses[1:]))
+        return list(min(itertools.permutations(fields), key=total_transit))
+
+    def moved_to(self, field):
+        """The arm is at the top of 'field' (where a field measurement ends)"""
+        self.posej = list(self.start_fields[field])
+
+    def start_cycle(self):
+        self._cycle_start = time.monotonic()
+
+    def end_cycle(self):
+        if self._cycle_start is not None:
+            self.cycle_times.append(time.monotonic() - self._cycle_start)
+            self._cycle_start = None
+
+    def cycle_estimate(self, mode):
+        """Estimated duration of a cycle over all the fields, from the current pose (s)"""
+        posej = self.posej
+        total = 0.0
+        for j in self.order():
+            total += transit_time(posej, self.start_fields[j]) + self.plans[j].column_time(mode)
+            posej = self.start_fields[j]
+        return total
+
+    def report(self):
+        """Time per cycle, for the end of a recording"""
+        if not self.cycle_times:
+            return ""
+        mean = sum(self.cycle_times) / len(self.cycle_times)
+        return f"Cycles: {len(self.cycle_times)} complete, {mean:.1f} s per cycle of {len(self.start_fields)} fields"
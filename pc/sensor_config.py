@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Description of the sensors: command sent at connection, output rate, grammar of
+their lines and channels. The parsers, the ring buffers and the CSV columns are
+built from these descriptions: to add a channel or change the rate, edit them here.
+The sensors themselves are the plugins of sensor_plugins.
+"""
+
+from collections import namedtuple
+
+from parsers import LabelledParser, LineParser
+
+# One value of a sensor:
+#     'name': CSV column, 'unit': second header row ("deg" channels are angles),
+#     'key': label of the value in the line (labelled grammar) or source asked to the analyser (columns grammar),
+#     'option': GUI checkbox recording the channel
+Channel = namedtuple("Channel", ["name", "unit", "key", "option"])
+
+
+class SensorDescription():
+    """Configuration of one sensor"""
+
+    def __init__(self, name, channels, options, init_command, rate=20, grammar="columns",
+                 delimiter=None, separator=b"\n", first_field=0):
+        """
+        Params:\n
+            - 'channels': Channel of each value, in the order of the CSV columns
+            - 'options': label of the GUI checkbox of each option of the channels, {option: label}
+            - 'init_command': command sent at connection, formatted with {rate} and {sources}
+              (the keys of the channels, quoted and separated by spaces)
+            - 'rate': output rate asked to the sensor (Hz)
+            - 'grammar': "labelled" (each value follows its key) or "columns" (the values
+              in the order of the channels from 'first_field' on)
+            - 'delimiter', 'separator': see parsers.LineParser
+        """
+        if grammar not in ("labelled", "columns"):
+            raise ValueError(f"Unknown grammar '{grammar}', expected 'labelled' or 'columns'")
+        self.name = name
+        self.channels = list(channels)
+        self.options = dict(options)
+        self.init_command = init_command
+        self.rate = rate
+        self.grammar = grammar
+        self.delimiter = delimiter
+        self.separator = separator
+        self.first_field = first_field
+
+    @property
+    def nb_channels(self):
+        return len(self.channels)
+
+    @property
+    def angles(self):
+        """Channels holding angles in degrees"""
+        return [i for i, channel in enumerate(self.channels) if channel.unit == "deg"]
+
+    def command(self):
+        """Bytes sent to configure the sensor"""
+        sources = " ".join(f'"{channel.key}"' for channel in self.channels)
+        return self.init_command.format(rate=self.rate, sources=sources).encode()
+
+    def parser(self):
+        """New parser of the lines of the sensor"""
+        if self.grammar == "labelled":
+            return LabelledParser([channel.key for channel in self.channels], self.delimiter, self.separator)
+        return LineParser(range(self.first_field, self.first_field + self.nb_channels), self.delimiter, self.separator)
+
+    def selected(self, options):
+        """Indices of the channels recorded with the GUI 'options' ({option: bool})"""
+        return [i for i, channel in enumerate(self.channels) if options.get(channel.option)]
+
+    def used(self, options):
+        """True if some channel of the sensor is recorded"""
+        return bool(self.selected(options))
+
+
+# Anemometer on a serial port: 'U 1.50 V -0.50 W 0.00 T 21.00 H 45.00 P 1013.00 MD 180'
+WIND = SensorDescription(
+    "wind",
+    [Channel("Wind (U)", "m/s", "U", "wind"),
+     Channel("Wind (V)", "m/s", "V", "wind"),
+     Channel("Wind (W)", "m/s", "W", "wind"),
+     Channel("Magnetic", "deg", "MD", "wind"),
+     Channel("Temperature", "degC", "T", "temp"),
+     Channel("Pressure", "hPa", "P", "pres")],
+    {"wind": "Wind", "temp": "Temperature", "pres": "Pressure"},
+    "\x03hide S\rhide D\rhide Pitch\rhide Roll\routputrate {rate}\rexit\r",
+    grammar="labelled")
+
+# CO2/H2O analyser on USB: 'DATA<tab>time<tab>' then the sources asked, in order
+CO2 = SensorDescription(
+    "co2",
+    [Channel("CO2", "umol/mol", "CO2B um/m", "co2"),
+     Channel("Humidity", "mmol/mol", "H2OB mm/m", "hum"),
+     Channel("Pressure CO2", "kPa", "P kPa", "intern_co2"),
+     Channel("Temperature CO2", "degC", "T C", "intern_co2")],
+    {"co2": "CO2", "hum": "H2O", "intern_co2": "P and T (CO2)"},
+    "(USB(Rate {rate}Hz)(Sources ({sources})))\n",
+    delimiter=b"\t", first_field=2)
+
+SENSORS = {sensor.name: sensor for sensor in (WIND, CO2)}
+
+# Covariances accumulated at each level of the Discontinuous mode (w'T', w'c', w'q'), by channel names
+FLUXES = [("Wind (W)", "Temperature"), ("Wind (W)", "CO2"), ("Wind (W)", "Humidity")]
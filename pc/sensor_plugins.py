@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Sensor plugins. A plugin is a class registered with @register that declares the
+description of its sensor (sensor_config) and its connection settings, and
+implements open(), read() and close(). Streaming, parsing and the ring buffer of
+timestamped samples are common to every plugin. The GUI checkboxes and settings,
+and the CSV columns, are built from the registered plugins: adding an instrument
+is adding a plugin here and its description in sensor_config.
+"""
+
+import threading
+import time
+
+import serial
+import usb.core
+import usb.util
+
+import sensor_config
+from sensors import RingBuffer, RateCounter
+
+PLUGINS = {}  # Registered plugin classes by sensor name, in the order of the CSV columns
+
+
+def register(cls):
+    """Class decorator making a plugin available to the GUI and the controller"""
+    PLUGINS[cls.description.name] = cls
+    return cls
+
+
+def options():
+    """GUI checkboxes of the registered plugins, {option: label}"""
+    return {option: label for cls in PLUGINS.values() for option, label in cls.description.options.items()}
+
+
+class SensorPlugin():
+    """Sensor streaming from its own reader thread into a ring buffer"""
+
+    description = None  # sensor_config.SensorDescription of the sensor
+    settings = ()  # (key, GUI label, default value) of each connection setting
+
+    def __init__(self, **settings):
+        """
+        Params:\n
+            - 'settings': connection settings, the defaults of the class for the missing ones
+        """
+        self.config = {key: default for key, _, default in self.settings}
+        self.config.update(settings)
+        self.parser = self.description.parser()
+        self.buffer = RingBuffer(self.description.nb_channels, angles=self.description.angles)
+        self.rate = RateCounter()
+        self.raw = None  # Called with (name, times, values) of every sample during a raw capture
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def name(self):
+        return self.description.name
+
+    @property
+    def channels(self):
+        return self.description.channels
+
+    # ==== Transport, implemented by each plugin ====
+    def open(self):
+        """Connect to the sensor and send its init command, raise an exception if it is not found"""
+        raise NotImplementedError
+
+    def read(self):
+        """Bytes received from the sensor, b"" if none within about a second"""
+        raise NotImplementedError
+
+    def recover(self):
+        """Called after a read error, e.g. to reconnect a sensor that was unplugged"""
+        self._stop.wait(1)
+
+    def close(self):
+        """Release the connection"""
+
+    # ==== Streaming ====
+    def start_stream(self):
+        """Read the sensor in a background thread until stop_stream()"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop_stream(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                data = self.read()
+                if data:
+                    now = time.monotonic()
+                    values = self.parser.feed(data)
+                    times = self.buffer.extend(now, values, self.sample_period())
+                    if len(values):
+                        self.rate.tick(now, len(values))
+                        raw = self.raw
+                        if raw is not None:
+                            raw(self.name, times, values)
+            except Exception:
+                # Missing values show up as stale at acquisition time
+                self.parser.clear()
+                self.recover()
+
+    def sample_period(self):
+        """Time between two samples, measured or else the rate asked at connection (s)"""
+        rate = self.rate.rate
+        return 1 / (rate if rate > 0 else self.description.rate)
+
+    # ==== Samples, without blocking ====
+    def latest(self):
+        """time.monotonic() and values of the newest sample, see RingBuffer.latest()"""
+        return self.buffer.latest()
+
+    def at(self, t, max_staleness=0.5, interpolate=True):
+        """Values at time.monotonic() 't', see RingBuffer.at()"""
+        return self.buffer.at(t, max_staleness, interpolate)
+
+
+@register
+class WindSensor(SensorPlugin):
+    """Anemometer on a serial port"""
+
+    description = sensor_config.WIND
+    settings = [("com", "Serial port wind sensor :", "COM6")]
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.ser = None
+
+    def open(self):
+        self.ser = serial.Serial(self.config["com"], 115200, timeout=1)
+        self.ser.write(self.description.command())
+
+    def read(self):
+        # Everything waiting in the port, at least one byte (blocks up to the port timeout)
+        return self.ser.read(self.ser.in_waiting or 1)
+
+    def close(self):
+        if self.ser:
+            self.ser.close()
+
+
+@register
+class CO2Sensor(SensorPlugin):
+    """CO2/H2O analyser on USB"""
+
+    description = sensor_config.CO2
+    settings = [("vendor", "CO2 idVendor :", "1509"), ("product", "CO2 idProduct :", "0A02")]
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.dev = None
+
+    def find(self):
+        """Look for the analyser on the USB bus (replaced by a fake device in sensor_simulator)"""
+        return usb.core.find(idVendor=int(self.config["vendor"], 16), idProduct=int(self.config["product"], 16))
+
+    def open(self):
+        self.dev = self.find()
+        if self.dev is None:
+            raise ValueError('Device not found.')
+        self.dev.set_configuration()
+        self.dev.write(0x02, self.description.command(), timeout=1000)
+
+    def read(self):
+        if self.dev is None:
+            raise ValueError("error")
+        try:
+            return bytes(self.dev.read(0x86, 64, timeout=1000))
+        except usb.core.USBTimeoutError:
+            return b""
+
+    def recover(self):
+        self.dev = self.find()
+        if self.dev:
+            self.dev.set_configuration()
+        else:
+            self._stop.wait(1)  # Do not scan the USB bus in a busy loop
+
+    def release(self):
+        usb.util.release_interface(self.dev, 0)
+
+    def close(self):
+        if self.dev:
+            self.release()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Stand-ins for the sensors, producing the lines parsed by the plugins of sensor_plugins:
+    - FakeWindSensor: pty-backed serial port emitting the anemometer lines (Linux only)
+    - FakeCO2Device: object behaving like the usb.core device of the CO2 analyser
+"""
+
+import array
+import errno
+import fcntl
+import math
+import os
+import random
+import re
+import termios
+import threading
+import time
+import tty
+
+import usb.core
+
+import sensor_plugins
+
+
+class SignalGenerator():
+    """Slowly varying values with some noise, one per channel"""
+
+    def __init__(self, means, amplitudes, noise, period=60.0, seed=None):
+        self.means = means
+        self.amplitudes = amplitudes
+        self.noise = noise
+        self.period = period
+        self._random = random.Random(seed)
+
+    def sample(self, t):
+        phase = 2 * math.pi * t / self.period
+        return [m + a * math.sin(phase + i) + self._random.gauss(0, n)
+                for i, (m, a, n) in enumerate(zip(self.means, self.amplitudes, self.noise))]
+
+
+class Emitter():
+    """Base class emitting lines at a fixed rate from a background thread"""
+
+    def __init__(self, rate):
+        """
+        Params:\n
+            - 'rate': output rate (Hz); None to follow the rate asked by the init command of the sensor
+        """
+        self.fixed_rate = rate
+        self.rate = rate if rate else 20
+        self.nb_lines = 0  # Lines produced by the sensor
+        self.nb_dropped = 0  # Lines lost because the host did not read fast enough
+        self._stop = threading.Event()
+        self._thread = None
+        self._t0 = time.monotonic()
+
+    def line(self, t):
+        """Line produced at time 't' (s since start)"""
+        raise NotImplementedError
+
+    def emit(self, data):
+        """Hand one line over to the host side, return False if it was dropped"""
+        raise NotImplementedError
+
+    def set_rate(self, rate):
+        """Rate asked by the host, ignored when the rate is fixed"""
+        if not self.fixed_rate and rate > 0:
+            self.rate = rate
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            t = time.monotonic() - self._t0
+            self.nb_lines += 1
+            if not self.emit(self.line(t).encode("ascii")):
+                self.nb_dropped += 1
+            next_time += 1 / self.rate
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+class FakeWindSensor(Emitter):
+    """
+    Anemometer on a pseudo-terminal. Open 'port' with pyserial like the real COM port.
+    Line layout after 'hide S/hide D/hide Pitch/hide Roll': U, V, W, T, H, P, MD
+    """
+
+    def __init__(self, rate=None, seed=None):
+        super().__init__(rate)
+        self.generator = SignalGenerator([1.5, -0.5, 0.0, 21.0, 45.0, 1013.0, 180.0],
+                                         [1.0, 1.0, 0.2, 2.0, 5.0, 1.0, 20.0],
+                                         [0.3, 0.3, 0.1, 0.05, 0.2, 0.05, 1.0], seed=seed)
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        fl = fcntl.fcntl(self._master, fcntl.F_GETFL)
+        fcntl.fcntl(self._master, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+        self.port = os.ttyname(self._slave)
+        self._commands = b""
+
+    def line(self, t):
+        u, v, w, temp, hum, pres, mag = self.generator.sample(t)
+        return (f"U {u:06.2f} V {v:06.2f} W {w:06.2f} T {temp:05.2f} H {hum:05.2f} "
+                f"P {pres:07.2f} MD {mag:03.0f}\r\n")
+
+    def _read_commands(self):
+        """Handle the configuration sent by WindSensor.open ('outputrate 20')"""
+        try:
+            self._commands += os.read(self._master, 1024)
+        except (BlockingIOError, OSError):
+            return
+        *commands, self._commands = self._commands.split(b"\r")
+        for command in commands:
+            match = re.match(rb"\x03?outputrate (\d+)", command.strip())
+            if match:
+                self.set_rate(int(match.group(1)))
+
+    def emit(self, data):
+        self._read_commands()
+        try:
+            os.write(self._master, data)
+            return True
+        except BlockingIOError:
+            return False
+
+    def backlog(self):
+        """Bytes written but not read yet by the host"""
+        buf = array.array("i", [0])
+        fcntl.ioctl(self._slave, termios.FIONREAD, buf)
+        return buf[0]
+
+    def close(self):
+        super().close()
+        os.close(self._master)
+        os.close(self._slave)
+
+
+class FakeCO2Device(Emitter):
+    """
+    CO2/H2O analyser behaving like the usb.core device used by CO2Sensor.
+    Tab separated line: DATA, time, CO2 (um/m), H2O (mm/m), P (kPa), T (C)
+    """
+
+    def __init__(self, rate=None, fifo_size=4096, seed=None):
+        """
+        Params:\n
+            - 'fifo_size': bytes the analyser keeps before dropping lines
+        """
+        super().__init__(rate)
+        self.generator = SignalGenerator([420.0, 10.0, 101.3, 25.0], [15.0, 1.0, 0.1, 1.0],
+                                         [1.0, 0.05, 0.01, 0.02], seed=seed)
+        self.fifo_size = fifo_size
+        self.nb_bytes_read = 0
+        self._fifo = bytearray()
+        self._cond = threading.Condition()
+
+    def line(self, t):
+        co2, h2o, pres, temp = self.generator.sample(t)
+        return f"DATA\t{t:.2f}\t{co2:.2f}\t{h2o:.3f}\t{pres:.3f}\t{temp:.2f}\n"
+
+    def emit(self, data):
+        with self._cond:
+            if len(self._fifo) + len(data) > self.fifo_size:
+                return False
+            self._fifo += data
+            self._cond.notify()
+        return True
+
+    # ==== usb.core.Device interface used by CO2Sensor ====
+    def set_configuration(self):
+        if self._thread is None:
+            self.start()
+
+    def write(self, endpoint, data, timeout=None):
+        match = re.search(rb"Rate (\d+)Hz", bytes(data))
+        if match:
+            self.set_rate(int(match.group(1)))
+        return len(data)
+
+    def read(self, endpoint, size, timeout=None):
+        with self._cond:
+            if not self._fifo:
+                self._cond.wait(timeout / 1000 if timeout else None)
+            if not self._fifo:
+                raise usb.core.USBTimeoutError("Operation timed out", errno=errno.ETIMEDOUT)
+            chunk = self._fifo[:size]
+            del self._fifo[:size]
+        self.nb_bytes_read += len(chunk)
+        return array.array("B", chunk)
+
+    def release(self):
+        pass
+
+    def backlog(self):
+        """Bytes produced but not read yet by the host"""
+        return len(self._fifo)
+
+
+def plug(robot, wind=None, co2=None):
+    """Give a TCPClient the plugins of fake sensors instead of the real serial port and USB device"""
+    if wind is not None:
+        wind.start()
+        robot.sensors["wind"] = sensor_plugins.WindSensor(com=wind.port)
+    if co2 is not None:
+        plugin = sensor_plugins.CO2Sensor()
+        plugin.find = lambda: co2
+        plugin.release = co2.release
+        robot.sensors["co2"] = plugin
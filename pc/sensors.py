@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+"""
+
+import time
+
+import numpy as np
+
+
+class RingBuffer():
+    """
+    Fixed-size history of one sensor: time.monotonic() times and float values.
+    Written by the reader thread of the sensor only; the sample count is increased
+    after the sample is stored, so other threads never see a half-written sample.
+    """
+
+    def __init__(self, nb_channels, size=1024, angles=()):
+        """
+        Params:\n
+            - 'nb_channels': number of values of each sample
+            - 'size': number of samples kept
+            - 'angles': channels holding angles in degrees, interpolated across 360 -> 0
+        """
+        self.size = size
+        self.angles = list(angles)
+        self.times = np.full(size, np.nan)
+        self.values = np.full((size, nb_channels), np.nan)
+        self.count = 0  # Samples written since the start
+
+    def append(self, t, values):
+        """Store one sample (NaN for a value that could not be read)"""
+        i = self.count % self.size
+        self.times[i] = t
+        self.values[i] = values
+        self.count += 1
+
+    def extend(self, t, values, period=0.0):
+        """
+        Store the samples 'values' (one row each) received together at time 't':
+        the last one is dated 't', the previous ones 'period' apart before it,
+        never before the samples already stored; return their times
+        """
+        n = len(values)
+        if n == 0:
+            return np.empty(0)
+        times = t - period * np.arange(n - 1, -1, -1)
+        if self.count:
+            times = np.maximum(times, self.times[(self.count - 1) % self.size])
+        for i in range(n):
+            self.append(times[i], values[i])
+        return times
+
+    def last(self, n=None):
+        """Times and values of the last 'n' samples, oldest first"""
+        count = self.count
+        # The oldest slot is left out: the writer may be filling it
+        available = min(count, self.size - 1)
+        n = available if n is None else min(n, available)
+        index = np.arange(count - n, count) % self.size
+        return self.times[index], self.values[index]
+
+    def since(self, count):
+        """
+        Times and values of the samples written after the first 'count' ones, oldest first,
+        and the count to ask for the next ones. Samples already overwritten are skipped.
+        """
+        end = self.count
+        n = min(end - count, self.size - 1)
+        index = np.arange(end - n, end) % self.size
+        return self.times[index], self.values[index], end
+
+    def latest(self):
+        """Time and values of the newest sample, (nan, nan values) if none"""
+        times, values = self.last(1)
+        if len(times) == 0:
+            return np.nan, np.full(self.values.shape[1], np.nan)
+        return times[0], values[0]
+
+    def at(self, t, max_staleness=0.5, interpolate=True):
+        """
+        Values of the sensor at time 't'.
+        Linear interpolation between the samples around 't' (or the nearest sample
+        if 'interpolate' is False or 't' is not surrounded yet). Values are NaN when
+        the nearest sample used is more than 'max_staleness' seconds away from 't'.
+        """
+        times, values = self.last()
+        nb_channels = self.values.shape[1]
+        if len(times) == 0:
+            return np.full(nb_channels, np.nan)
+
+        k = np.searchsorted(times, t)
+        if 0 < k < len(times):
+            t0, t1 = times[k - 1], times[k]
+            staleness = min(t - t0, t1 - t)
+            if staleness > max_staleness:
+                return np.full(nb_channels, np.nan)
+            if interpolate and t1 > t0:
+                delta = values[k] - values[k - 1]
+                delta[self.angles] = (delta[self.angles] + 180) % 360 - 180
+                result = values[k - 1] + delta * (t - t0) / (t1 - t0)
+                result[self.angles] %= 360
+                return result
+            return values[k - 1] if t - t0 <= t1 - t else values[k]
+
+        nearest = 0 if k == 0 else len(times) - 1
+        if abs(t - times[nearest]) > max_staleness:
+            return np.full(nb_channels, np.nan)
+        return values[nearest]
+
+
+class RateCounter():
+    """Count the samples of one sensor and estimate its sample rate"""
+
+    def __init__(self, window=1.0):
+        """
+        Params:\n
+            - 'window': duration over which the rate is averaged (s)
+        """
+        self.window = window
+        self.count = 0  # Samples since the start
+        self.rate = 0.0  # Samples per second over the last window
+        self.last_time = None  # Time of the last sample
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def tick(self, now=None, n=1):
+        """Record 'n' samples (called by the reader thread only)"""
+        now = time.monotonic() if now is None else now
+        self.count += n
+        self.last_time = now
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self.rate = (self.count - self._window_count) / elapsed
+            self._window_start = now
+            self._window_count = self.count
+
+
+def to_float(value):
+    """Convert a value read from a sensor, NaN if it is not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+"""
+
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from journal import Journal
+from level_stats import LevelStatistics
+from raw_capture import RawCapture
+from recording import WRITERS
+
+# Boundary of the measurement (field start, pass start, field end...) written in the data queue
+Marker = namedtuple("Marker", ["name", "field", "time"])
+
+
+class LiveQueue(queue.Queue):
+    """
+    Rows and markers waiting for the live plot: rows are dropped when 'max_rows' items
+    are waiting, markers are always queued so the plot never merges two fields
+    """
+
+    def __init__(self, max_rows):
+        super().__init__()
+        self.max_rows = max_rows
+
+    def put_row(self, row):
+        """Queue a row, False if it is dropped"""
+        if self.qsize() >= self.max_rows:
+            return False
+        self.put_nowait(row)
+        return True
+
+
+class AcquisitionSession():
+    """
+    Sensor readers and data writer of one robot connection.
+    Sensors are started at connection and keep streaming until disconnection;
+    each recording keeps one writer for the whole campaign, and fields and passes
+    are marked in the data stream instead of restarting everything.
+    """
+
+    def __init__(self, robot, flush_rows=100, flush_latency=0.5):
+        """
+        Params:\n
+            - 'robot': connected TCPClient whose sensors are read
+            - 'flush_rows': rows written together
+            - 'flush_latency': longest time a row waits before being written (s),
+              so a crash loses at most this much data in the CSV file; the npz format
+              saves its chunks when full and at each field end only (see recording.NpzWriter),
+              its rows in between are kept by the journal
+        """
+        self.robot = robot
+        self.flush_rows = flush_rows
+        self.flush_latency = flush_latency
+        self.on_error = None  # Called with the error message when the rows can't be written
+        self.live = None  # LiveQueue of the live plot (live_plot.LivePlot.rows), or None
+        self.nb_lost_rows = 0  # Rows missing from at least one format
+        self.lost_rows = {}  # Rows missing from each format, by writer class name
+        self._last_error = None
+        self.data_queue = queue.Queue()
+        self.events = []  # Markers of the current recording
+        self.filename = None
+        self.writers = []  # One per recording format
+        self.journal = None  # Write-ahead journal of the recording
+        self.raw = None  # raw_capture.RawCapture of the recording, if any
+        self.levels = None  # level_stats.LevelStatistics of a Discontinuous recording, if any
+        self.field = 0
+        self.pass_number = 0
+        self.remaining = []  # Indices (from 0) of the fields left in the cycle, journaled for a resume
+        self._recording_start = None
+
+        self._stop_sensors = threading.Event()
+        self._sensor_thread = None
+        self._stop_writing = threading.Event()
+        self._writer_thread = None
+
+    def start(self):
+        """Start reading the sensors"""
+        self._stop_sensors.clear()
+        self._sensor_thread = threading.Thread(target=self.robot.get_data, args=(self._stop_sensors,), daemon=True)
+        self._sensor_thread.start()
+
+    def start_recording(self, filename, header, formats=("csv",), resume=None, raw=False, levels=False):
+        """
+        Create the recording files and start writing the rows put in `data_queue`.
+        Raise IOError if a file can't be created.
+
+        Params:\n
+            - 'header': names and units/flags rows of the CSV header
+            - 'formats': recording formats, keys of recording.WRITERS ("csv", "npz")
+            - 'resume': last checkpoint of an interrupted recording replayed with journal.replay(),
+              rows are then added to the existing files
+            - 'raw': also record every sensor sample and robot position in the raw files (see raw_capture)
+            - 'levels': also write the statistics of each level (see level_stats)
+        """
+        append = resume is not None
+        self.filename = filename
+        self.raw = None
+        self.writers = []
+        try:
+            for name in formats:
+                self.writers.append(WRITERS[name](filename, header, append))
+            self.raw = RawCapture(filename, self.robot, append) if raw else None
+            self.levels = LevelStatistics(filename, self.robot, append) if levels else None
+            self.journal = Journal(filename, header, formats, append, self.flush_rows, self.flush_latency)
+        except IOError:
+            # Nothing is recorded: release the files already created
+            for writer in self.writers:
+                writer.close()
+            self.writers = []
+            raise
+        self.events = []
+        elapsed = resume["elapsed"] if resume else 0
+        self._recording_start = time.time() - elapsed
+        self.data_queue = queue.Queue()
+        self._stop_writing.clear()
+        self._writer_thread = threading.Thread(target=self.writer_thread, daemon=True)
+        self._writer_thread.start()
+        if self.raw:
+            self.raw.start()
+
+    def elapsed(self):
+        """Measurement time of the recording, including the time before a resume (s)"""
+        return time.time() - self._recording_start
+
+    def put(self, row):
+        """Journal one measurement row and queue it for writing"""
+        if self.journal:
+            self.journal.append(row)
+        self.data_queue.put(row)
+        self.show(row)
+
+    def mark(self, name, field):
+        """Mark a boundary of the measurement ('field_start', 'pass_start', 'field_end'...)"""
+        if name == "field_start":
+            self.pass_number = 0
+        elif name == "pass_start":
+            self.pass_number += 1
+        elif name == "field_end" and field - 1 in self.remaining:
+            self.remaining.remove(field - 1)
+        self.field = field
+        marker = Marker(name, field, time.time())
+        self.events.append(marker)
+        if self.journal:
+            self.journal.checkpoint(name, field, self.pass_number, self.elapsed(), list(self.remaining))
+        self.data_queue.put(marker)
+        self.show(marker)
+
+    def show(self, item):
+        """Give a row or a marker to the live plot; rows are dropped if the plot is behind"""
+        if self.live is None:
+            return
+        if isinstance(item, Marker):
+            self.live.put_nowait(item)
+        else:
+            self.live.put_row(item)
+
+    def stop_recording(self):
+        """Write the remaining rows and stop the writer"""
+        if self._writer_thread:
+            self._stop_writing.set()
+            self._writer_thread.join()
+            self._writer_thread = None
+            for writer in self.writers:
+                writer.close()
+            self.writers = []
+            # Everything is written: the journal is not needed any more
+            self.journal.close(delete=True)
+            self.journal = None
+        if self.raw:
+            self.raw.stop()
+
+    def close(self):
+        """Stop the recording and the sensor readers"""
+        self.stop_recording()
+        self._stop_sensors.set()
+        if self._sensor_thread:
+            self._sensor_thread.join()
+            self._sensor_thread = None
+
+    def writer_thread(self):
+        buffer = []
+        deadline = None  # Time at which the oldest buffered row must be written
+        while not self._stop_writing.is_set() or not self.data_queue.empty():
+            timeout = 0.1 if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.data_queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, Marker):
+                # End of a field: its rows are written and synced to disk
+                if item.name == "field_end":
+                    self.write_rows(buffer, sync=True)
+                    buffer.clear()
+                    deadline = None
+            elif item is not None:
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_latency
+                buffer.append(item)
+
+            if buffer and (len(buffer) >= self.flush_rows or time.monotonic() >= deadline):
+                self.write_rows(buffer)
+                buffer.clear()
+                deadline = None
+
+        # final flush if necessary
+        self.write_rows(buffer, sync=True)
+
+    def write_rows(self, rows, sync=False):
+        """Write 'rows' with every writer, reporting the errors through `on_error`"""
+        lost = False
+        for writer in self.writers:
+            try:
+                if rows:
+                    writer.write_rows(rows)
+                if sync:
+                    writer.sync()
+                else:
+                    writer.flush()
+            except (IOError, ValueError) as e:
+                lost = True
+                name = writer.__class__.__name__
+                self.lost_rows[name] = self.lost_rows.get(name, 0) + len(rows)
+                self.report_error(f"{name}: {e}")
+        if lost:
+            self.nb_lost_rows += len(rows)  # Once per batch, whatever the number of writers failing
+
+    def report_error(self, message):
+        # Same error on every batch: reported once
+        if message != self._last_error:
+            self._last_error = message
+            if self.on_error:
+                self.on_error(message)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Made by Arthur Saint Upery and Ewan Maurel
+
+Vertical trajectory of a field: the levels measured in the column, the passes
+over them and their duration. Levels are depths below the start position of
+the field (the top of the column), the deepest one at the ground or just above it.
+"""
+
+import math
+
+import numpy as np
+
+# Velocities and accelerations of robot.txt (mm/s and mm/s² for movel, deg/s and deg/s² for movej)
+MOTIONS = {
+    "goto": ("movel", 80, 10),
+    "sgoto": ("movel", 20, 5),
+    "gotoj": ("movej", 50, 50),
+    "sgotoj": ("movej", 2, 1),
+}
+
+SPACINGS = ("linear", "log")
+
+
+def motion_time(distance, vel, acc):
+    """Duration of a trapezoidal velocity profile over 'distance'"""
+    distance = abs(distance)
+    if distance >= vel ** 2 / acc:
+        return distance / vel + vel / acc
+    return 2 * math.sqrt(distance / acc)
+
+
+def level_depths(height, nb_levels, spacing="linear", min_height=None):
+    """
+    Depths below the top of the 'nb_levels' levels of a column of 'height' (mm), top included (0).
+
+    Params:\n
+        - 'spacing': "linear" (evenly spaced, the last level at the ground)
+          or "log" (log-spaced heights above the ground, dense near the ground)
+        - 'min_height': height above the ground of the last level in "log" spacing,
+          by default a tenth of the linear step
+    """
+    if nb_levels < 1:
+        raise ValueError("At least one level is needed")
+    if spacing == "linear":
+        return [height * k / nb_levels for k in range(nb_levels + 1)]
+    if spacing == "log":
+        if min_height is None:
+            min_height = height / nb_levels / 10
+        heights = np.geomspace(height, min_height, nb_levels + 1)
+        return [0.0] + [float(height - h) for h in heights[1:]]
+    raise ValueError(f"Unknown spacing '{spacing}', expected one of {SPACINGS}")
+
+
+class FieldPlan():
+    """Levels of a field and the passes over them"""
+
+    def __init__(self, depths, nb_passes=2, dwell=0.0):
+        """
+        Params:\n
+            - 'depths': depths of the levels below the top (mm), from the top (0) downwards
+            - 'nb_passes': passes over the column, alternately down and up
+            - 'dwell': time spent recording at each level in Discontinuous mode (s)
+        """
+        if nb_passes < 1:
+            raise ValueError("At least one pass is needed")
+        self.depths = list(depths)
+        self.nb_passes = nb_passes
+        self.dwell = dwell
+
+    @property
+    def nb_levels(self):
+        return len(self.depths) - 1
+
+    @property
+    def ends_at_top(self):
+        """False when the last pass goes down: the tool must come back up before leaving"""
+        return self.nb_passes % 2 == 0
+
+    def passes(self, mode="Discontinuous"):
+        """
+        Depths reached by each pass, each pass starting where the previous one ended.
+        In Continuous mode the positions are streamed all along: a pass is a single
+        motion to its end, without stopping at the levels in between.
+        """
+        down = self.depths[1:]
+        up = self.depths[-2::-1]
+        passes = [down if i % 2 == 0 else up for i in range(self.nb_passes)]
+        if mode == "Continuous":
+            return [depths[-1:] for depths in passes]
+        return passes
+
+    def column_time(self, mode, command="sgoto"):
+        """Estimated time spent in the column (s): measuring moves, dwell, and the return to the top"""
+        _, vel, acc = MOTIONS[command]
+        total = 0.0
+        depth = 0.0
+        for depths in self.passes(mode):
+            for target in depths:
+                total += motion_time(target - depth, vel, acc)
+                depth = target
+                if mode == "Discontinuous":
+                    total += self.dwell
+        if not self.ends_at_top:
+            _, vel, acc = MOTIONS["goto"]
+            total += motion_time(depth, vel, acc)
+        return total
+
+
+def plan_field(height, nb_levels, spacing="linear", nb_passes=2, dwell=0.0, min_height=None):
+    """FieldPlan of a column of 'height' (mm), see level_depths()"""
+    return FieldPlan(level_depths(height, nb_levels, spacing, min_height), nb_passes, dwell)